@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Registre persistant des assistants OpenAI.
+
+Chaque assistant est identifié par un nom logique ("extraction", "produits",
+"mail"). On stocke dans leads.db l'ID de l'assistant créé ainsi qu'une
+empreinte de sa définition (instructions, modèle, outils) : tant que la
+définition ne change pas, l'assistant existant est réutilisé d'un rerun
+Streamlit à l'autre et d'un processus à l'autre. Plusieurs versions d'un
+même assistant peuvent coexister (déploiement progressif) ; une version
+n'est supprimée qu'après ASSISTANT_RETENTION_DAYS jours sans utilisation.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from db import execute_write, get_connection, write
+
+# Une ancienne version n'est supprimée côté OpenAI qu'après ce délai sans utilisation :
+# pendant un déploiement progressif, les processus encore sur l'ancienne définition la gardent
+ASSISTANT_RETENTION_DAYS = float(os.getenv("ASSISTANT_RETENTION_DAYS", "30"))
+# Intervalle minimal entre deux mises à jour de last_used_at par un même processus
+_TOUCH_INTERVAL = 3600
+
+_lock = threading.Lock()
+# Cache mémoire {nom: (empreinte, assistant_id, date de la dernière mise à jour de last_used_at)}
+_memory_cache = {}
+
+
+def definition_hash(instructions, model, tools=None):
+    """Calcule l'empreinte SHA-256 de la définition d'un assistant."""
+    payload = json.dumps(
+        {"instructions": instructions, "model": model, "tools": tools or []},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _touch(name, digest, assistant_id):
+    """Signale que cette version est utilisée (au plus une écriture par heure et par processus)."""
+    now = time.time()
+    _memory_cache[name] = (digest, assistant_id, now)
+    execute_write("UPDATE assistants SET last_used_at = ? WHERE assistant_id = ?", (now, assistant_id), wait=False)
+
+
+def ensure_assistant(client, name, instructions, model, tools=None):
+    """
+    Retourne l'ID de l'assistant `name` pour cette définition, en le créant
+    uniquement si aucune version n'est enregistrée pour elle. Les autres
+    versions restent en place tant qu'elles ont servi récemment.
+    """
+    digest = definition_hash(instructions, model, tools)
+    cached = _memory_cache.get(name)
+    if cached and cached[0] == digest:
+        if time.time() - cached[2] > _TOUCH_INTERVAL:
+            _touch(name, digest, cached[1])
+        return cached[1]
+
+    with _lock:
+        row = get_connection().execute(
+            "SELECT assistant_id FROM assistants WHERE name = ? AND definition_hash = ?", (name, digest)
+        ).fetchone()
+        if row:
+            _touch(name, digest, row[0])
+            return row[0]
+
+        params = {"name": name, "instructions": instructions, "model": model}
+        if tools:
+            params["tools"] = tools
+        assistant = client.beta.assistants.create(**params)
+
+        def register(conn):
+            # Un autre processus a pu créer la même version entre-temps : la première enregistrée est gardée
+            conn.execute(
+                "INSERT OR IGNORE INTO assistants (name, definition_hash, assistant_id, last_used_at) VALUES (?, ?, ?, ?)",
+                (name, digest, assistant.id, time.time())
+            )
+            return conn.execute(
+                "SELECT assistant_id FROM assistants WHERE name = ? AND definition_hash = ?", (name, digest)
+            ).fetchone()[0]
+
+        assistant_id = write(register)
+        if assistant_id != assistant.id:
+            _delete_remote(client, assistant.id)
+        _memory_cache[name] = (digest, assistant_id, time.time())
+        _prune(client, name, digest)
+        return assistant_id
+
+
+def forget_assistant(name, assistant_id):
+    """
+    Oublie un assistant qui n'existe plus côté OpenAI (supprimé depuis le
+    tableau de bord, changement de projet) : le prochain ensure_assistant le
+    recrée.
+    """
+    with _lock:
+        cached = _memory_cache.get(name)
+        if cached and cached[1] == assistant_id:
+            del _memory_cache[name]
+        execute_write("DELETE FROM assistants WHERE assistant_id = ?", (assistant_id,))
+
+
+def _delete_remote(client, assistant_id):
+    try:
+        client.beta.assistants.delete(assistant_id)
+    except Exception:
+        pass
+
+
+def _prune(client, name, digest):
+    """Supprime les autres versions de `name` inutilisées depuis ASSISTANT_RETENTION_DAYS."""
+    cutoff = time.time() - ASSISTANT_RETENTION_DAYS * 86400
+    stale = get_connection().execute(
+        "SELECT assistant_id FROM assistants WHERE name = ? AND definition_hash != ? AND last_used_at < ?",
+        (name, digest, cutoff)
+    ).fetchall()
+    for (assistant_id,) in stale:
+        _delete_remote(client, assistant_id)
+        execute_write("DELETE FROM assistants WHERE assistant_id = ? AND last_used_at < ?", (assistant_id, cutoff))
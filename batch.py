@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Traitement par lot d'une pile de cartes de visite.
+
+Les cartes sont réparties sur un pool de workers ; chaque worker exécute le
+pipeline complet d'une carte. Les limiteurs par fournisseur (rate_limit.py)
+bornent la concurrence et le débit vers Mistral, OpenAI et Tavily, de sorte
+que les cartes avancent en parallèle à des étapes différentes. Les leads
+sont insérés par paquets, dans une transaction par paquet. Une carte qui
+correspond à un lead déjà enregistré est traitée selon BATCH_DUPLICATES
+(traiter la carte quand même, par défaut, réutiliser le lead ou le mettre
+à jour).
+
+Utilisable en ligne de commande :
+    python batch.py dossier_cartes/ cartes.zip --note "Salon VivaTech"
+"""
+import argparse
+import io
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from duplicates import DUPLICATE_ACTIONS
+from pipeline import API_KEYS_MISSING, NoTextError, process_card, save_leads
+
+# Nombre de cartes traitées simultanément et taille des paquets d'insertion
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "6"))
+BATCH_COMMIT_SIZE = int(os.getenv("BATCH_COMMIT_SIZE", "20"))
+# Décision appliquée aux doublons : "reuse", "update" ou "process"
+# Sans relecture possible, une carte n'est jamais remplacée par défaut par un lead existant
+BATCH_DUPLICATES = os.getenv("BATCH_DUPLICATES", "process")
+
+DUPLICATE_STATUS = {"reuse": "doublon de #{id}, réutilisé", "update": "doublon de #{id}, mis à jour"}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def images_from_zip(data):
+    """Retourne la liste (nom, octets) des images contenues dans une archive zip."""
+    cards = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or os.path.basename(name).startswith("."):
+                continue
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                cards.append((name, archive.read(info)))
+    return cards
+
+
+def images_from_path(path):
+    """Retourne la liste (nom, octets) des images d'un fichier, d'un zip ou d'un dossier."""
+    if os.path.isdir(path):
+        cards = []
+        for root, _, files in os.walk(path):
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    with open(os.path.join(root, filename), "rb") as f:
+                        cards.append((os.path.join(root, filename), f.read()))
+        return cards
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.lower().endswith(".zip"):
+        return images_from_zip(data)
+    return [(path, data)]
+
+
+def run_batch(cards, qualification, note, on_progress=None, max_workers=None, commit_size=None, duplicates=None):
+    """
+    Traite une liste de cartes (nom, octets) et insère les leads obtenus.
+    duplicates ("reuse", "update" ou "process") s'applique aux cartes déjà
+    enregistrées.
+
+    on_progress(traitees, total, resultat) est appelé après chaque carte.
+    Retourne la liste des résultats {"fichier", "statut", "nom", "prenom", "mail"}.
+    """
+    max_workers = max_workers or BATCH_MAX_WORKERS
+    commit_size = commit_size or BATCH_COMMIT_SIZE
+    duplicates = duplicates or BATCH_DUPLICATES
+    results = []
+    pending = []
+    handled = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(process_card, data, qualification, note, on_duplicate=lambda duplicate: duplicates): name
+        for name, data in cards
+    }
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            handled.add(future)
+            result = {"fichier": futures[future], "statut": "ok", "nom": "", "prenom": "", "mail": ""}
+            try:
+                lead = future.result()
+                pending.append(lead)
+                result.update(nom=lead["nom"], prenom=lead["prenom"], mail=lead["mail"])
+                if lead.get("duplicate_of") is not None:
+                    result["statut"] = DUPLICATE_STATUS[lead["duplicate_action"]].format(id=lead["duplicate_of"])
+            except NoTextError:
+                result["statut"] = "aucun texte"
+            except Exception as e:
+                result["statut"] = f"erreur : {e}"
+            if len(pending) >= commit_size:
+                save_leads(pending)
+                pending = []
+            results.append(result)
+            if on_progress:
+                on_progress(done, len(futures), result)
+    finally:
+        # Interruption (rerun Streamlit, onglet fermé, on_progress en erreur) : les cartes non commencées
+        # sont annulées, celles en cours sont attendues et, comme les cartes déjà traitées, enregistrées
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future not in handled and not future.cancelled() and future.exception() is None:
+                pending.append(future.result())
+        if pending:
+            save_leads(pending)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement par lot de cartes de visite.")
+    parser.add_argument("paths", nargs="+", help="Images, archives zip ou dossiers de cartes")
+    parser.add_argument("--qualification", default="Smart Talk")
+    parser.add_argument("--note", required=True, help="Note appliquée à toutes les cartes du lot")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS)
+    parser.add_argument("--duplicates", choices=DUPLICATE_ACTIONS, default=BATCH_DUPLICATES,
+                        help="Cartes déjà enregistrées : réutiliser, mettre à jour ou retraiter le lead")
+    args = parser.parse_args(argv)
+
+    if API_KEYS_MISSING:
+        sys.exit("Veuillez définir les variables OPENAI_API_KEY, MISTRAL_API_KEY et TAVILY_API_KEY dans votre environnement.")
+
+    cards = []
+    for path in args.paths:
+        cards.extend(images_from_path(path))
+
+    def report(done, total, result):
+        print(f"[{done}/{total}] {result['fichier']} : {result['statut']}")
+
+    results = run_batch(cards, args.qualification, args.note, on_progress=report, max_workers=args.workers,
+                        duplicates=args.duplicates)
+    ok = sum(1 for r in results if r["statut"] == "ok")
+    print(f"{ok}/{len(results)} cartes traitées avec succès.")
+
+
+if __name__ == "__main__":
+    main()
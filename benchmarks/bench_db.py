@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de charge de leads.db sous accès concurrents.
+
+Des threads insèrent des leads pendant que d'autres lisent des pages de la
+liste, sur une base temporaire. Le mode "db" passe par la couche db.py (WAL,
+thread écrivain unique, connexion de lecture par thread) ; le mode "naive"
+reproduit l'ancien fonctionnement (une connexion partagée, un commit par
+insertion, journal par défaut). La connexion partagée y est protégée par un
+verrou : les triggers FTS appellent une fonction SQL Python (décompression
+des textes, voir text_store.py) et un accès concurrent sans verrou finit en
+interblocage entre le GIL et le mutex de SQLite.
+
+    python benchmarks/bench_db.py --writers 8 --readers 4 --inserts 500
+    python benchmarks/bench_db.py --mode naive
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_store import register_functions, store_texts
+
+# Même enregistrement que pipeline.save_lead, sans importer les clients d'API
+INSERT_LEAD_SQL = (
+    "INSERT INTO leads (nom, prenom, telephone, mail, qualification, note) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def lead(writer, i):
+    values = (f"Nom{i}", f"Prenom{writer}", "0123456789", f"contact{writer}.{i}@exemple.fr", "Smart Talk", "Note de test")
+    texts = {"ocr_text": f"OCR carte {writer}-{i}", "agent1": "Réponse agent1", "agent2": "Réponse agent2",
+             "agent3": "Réponse agent3"}
+    return values, texts
+
+
+def save(conn, values, texts):
+    store_texts(conn, conn.execute(INSERT_LEAD_SQL, values).lastrowid, texts)
+
+
+def run(mode, writers, readers, inserts, path):
+    if mode == "db":
+        import db
+
+        insert = lambda values, texts: db.write(lambda conn: save(conn, values, texts))
+        read = lambda sql: db.get_connection().execute(sql).fetchall()
+    else:
+        from migrations import migrate
+
+        shared = sqlite3.connect(path, check_same_thread=False)
+        register_functions(shared)
+        migrate(shared)
+        shared_lock = threading.Lock()
+
+        def insert(values, texts):
+            with shared_lock:
+                save(shared, values, texts)
+                shared.commit()
+
+        def read(sql):
+            with shared_lock:
+                return shared.execute(sql).fetchall()
+
+    errors = {"write": 0, "read": 0}
+    counts = {"write": 0, "read": 0}
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def writer(n):
+        for i in range(inserts):
+            try:
+                insert(*lead(n, i))
+                failed = False
+            except Exception:
+                # La connexion partagée du mode naïf lève aussi des erreurs hors sqlite3.Error
+                failed = True
+            with lock:
+                counts["write"] += not failed
+                errors["write"] += failed
+
+    def reader():
+        while not done.is_set():
+            try:
+                read("SELECT id, nom, prenom, mail, timestamp FROM leads ORDER BY timestamp DESC, id DESC LIMIT 50")
+                failed = False
+            except sqlite3.Error:
+                failed = True
+            with lock:
+                counts["read"] += not failed
+                errors["read"] += failed
+
+    start = time.perf_counter()
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+    print(f"Mode                 : {mode}")
+    print(f"Durée                : {elapsed:.2f} s")
+    print(f"Insertions           : {counts['write']} ({counts['write'] / elapsed:.0f}/s), erreurs : {errors['write']}")
+    print(f"Lectures             : {counts['read']} ({counts['read'] / elapsed:.0f}/s), erreurs : {errors['read']}")
+    print(f"Lignes en base       : {rows}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("db", "naive"), default="db")
+    parser.add_argument("--writers", type=int, default=8, help="Threads d'insertion")
+    parser.add_argument("--readers", type=int, default=4, help="Threads de lecture")
+    parser.add_argument("--inserts", type=int, default=500, help="Insertions par thread d'insertion")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        # Doit être défini avant l'import de db.py
+        os.environ["LEADS_DB"] = path
+        run(args.mode, args.writers, args.readers, args.inserts, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la préparation des images avant OCR.
+
+Mesure, sur un jeu d'images (dossier ou cartes synthétiques), la taille
+envoyée à Mistral OCR et le temps de préparation, avant et après
+preprocess_image. Avec --ocr (et MISTRAL_API_KEY définie), mesure aussi la
+latence réelle de l'appel OCR dans les deux cas.
+
+    python benchmarks/bench_image_prep.py --synthetic 10
+    python benchmarks/bench_image_prep.py photos_cartes/ --ocr
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from image_prep import preprocess_image, sniff_mime
+
+
+def synthetic_cards(count, width=4032, height=3024, seed=0):
+    """Génère des photos de cartes de visite au format d'un appareil photo de téléphone."""
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        image = Image.new("RGB", (width, height), (rng.randint(90, 140),) * 3)
+        draw = ImageDraw.Draw(image)
+        left, top = rng.randint(200, 800), rng.randint(200, 600)
+        draw.rectangle((left, top, left + 2600, top + 1500), fill=(245, 245, 240))
+        for line in range(6):
+            draw.text((left + 150, top + 150 + line * 200), f"Ligne {line} carte {i} contact@exemple.fr", fill=(20, 20, 20))
+        # Bruit de capteur : empêche une compression irréaliste de l'original
+        noise = Image.effect_noise((width, height), 20).convert("RGB")
+        image = Image.blend(image, noise, 0.15)
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=95)
+        cards.append((f"synthetique_{i}.jpg", output.getvalue()))
+    return cards
+
+
+def load_directory(path):
+    cards = []
+    for filename in sorted(os.listdir(path)):
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(path, filename), "rb") as f:
+                cards.append((filename, f.read()))
+    return cards
+
+
+def ocr_latency(client, image_bytes, mime):
+    data_uri = f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+    start = time.perf_counter()
+    client.ocr.process(model="mistral-ocr-latest", document={"type": "image_url", "image_url": data_uri})
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="Dossier d'images de cartes")
+    parser.add_argument("--synthetic", type=int, default=0, help="Nombre de cartes synthétiques à générer")
+    parser.add_argument("--ocr", action="store_true", help="Mesurer aussi la latence de Mistral OCR")
+    args = parser.parse_args(argv)
+
+    cards = load_directory(args.directory) if args.directory else []
+    if args.synthetic or not cards:
+        cards += synthetic_cards(args.synthetic or 5)
+
+    client = None
+    if args.ocr:
+        from mistralai import Mistral
+        client = Mistral(api_key=os.environ["MISTRAL_API_KEY"])
+
+    before_sizes, after_sizes, prep_times, ocr_before, ocr_after = [], [], [], [], []
+    for name, data in cards:
+        start = time.perf_counter()
+        processed, mime = preprocess_image(data)
+        prep_times.append(time.perf_counter() - start)
+        before_sizes.append(len(data))
+        after_sizes.append(len(processed))
+        line = f"{name:30s} {len(data) / 1024:9.0f} Ko -> {len(processed) / 1024:7.0f} Ko"
+        if client:
+            ocr_before.append(ocr_latency(client, data, sniff_mime(data)))
+            ocr_after.append(ocr_latency(client, processed, mime))
+            line += f"   OCR {ocr_before[-1]:.2f} s -> {ocr_after[-1]:.2f} s"
+        print(line)
+
+    total_before, total_after = sum(before_sizes), sum(after_sizes)
+    print()
+    print(f"Images               : {len(cards)}")
+    print(f"Taille totale        : {total_before / 1024:.0f} Ko -> {total_after / 1024:.0f} Ko "
+          f"({100 * (1 - total_after / total_before):.1f} % de moins)")
+    print(f"Préparation (médiane): {1000 * statistics.median(prep_times):.0f} ms")
+    if client:
+        print(f"OCR (médiane)        : {statistics.median(ocr_before):.2f} s -> {statistics.median(ocr_after):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark hors ligne du pipeline complet, sans crédit d'API ni réseau.
+
+Mistral OCR, OpenAI (API Assistants ou chat completions) et Tavily sont
+remplacés par les doublures de benchmarks/fakes.py, avec des latences
+log-normales configurables ("médiane" ou "médiane:sigma", en secondes).
+Tout le reste est le code réel : préparation des images, caches, limiteurs
+de débit, file de jobs, couche db.py, sur une base temporaire.
+
+Phases (--phases) :
+- single : cartes traitées une à une (latence de bout en bout et par étape) ;
+- batch  : run_batch sur le corpus (débit en cartes par minute) ;
+- jobs   : parcours de code.py, submit_job puis workers de la file ;
+- db     : enregistrement concurrent de leads (débit d'écriture).
+
+    python benchmarks/bench_pipeline.py --cards 30 --scale 0.2
+    python benchmarks/bench_pipeline.py --backend chat --ocr-latency 3:0.5 --phases single,batch
+
+Les limiteurs de débit gardent leur configuration (variables
+<FOURNISSEUR>_MAX_CONCURRENCY / <FOURNISSEUR>_RATE_PER_MIN).
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ("single", "batch", "jobs", "db")
+
+
+def percentiles(values):
+    """(p50, p95, p99) d'une liste de valeurs."""
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return statistics.median(values), cuts[94], cuts[98]
+
+
+def print_distribution(title, values, unit="ms"):
+    p50, p95, p99 = percentiles(values)
+    print(f"  {title:22s} n={len(values):4d}  p50 {p50:9.1f} {unit}  p95 {p95:9.1f} {unit}  p99 {p99:9.1f} {unit}")
+
+
+def synthetic_card(seed, width, height):
+    """Photo de carte fictive : fond, carte, logo et lignes de texte à des positions et couleurs aléatoires."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    color = lambda low, high: tuple(rng.randint(low, high) for _ in range(3))
+    image = Image.new("RGB", (width, height), color(60, 160))
+    draw = ImageDraw.Draw(image)
+    left, top = rng.randint(50, width // 4), rng.randint(50, height // 4)
+    card_width, card_height = int(width * rng.uniform(0.55, 0.7)), int(height * rng.uniform(0.5, 0.65))
+    draw.rectangle((left, top, left + card_width, top + card_height), fill=color(200, 255))
+    for _ in range(rng.randint(2, 5)):
+        x, y = left + rng.randint(0, card_width * 3 // 4), top + rng.randint(0, card_height * 3 // 4)
+        size = rng.randint(40, card_width // 4)
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape((x, y, x + size, y + size * rng.uniform(0.3, 1)), fill=color(0, 200))
+    for line in range(rng.randint(3, 7)):
+        y = top + card_height // 3 + line * card_height // 10
+        x = left + rng.randint(20, card_width // 3)
+        draw.rectangle((x, y, x + rng.randint(card_width // 5, card_width // 2), y + card_height // 25), fill=(30, 30, 30))
+    # Bruit de capteur : taille de fichier réaliste
+    image = Image.blend(image, Image.effect_noise((width, height), 20).convert("RGB"), 0.1)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def corpus(count, seed, width, height):
+    return [(f"carte_{seed}_{i}.jpg", synthetic_card(seed * 10000 + i, width, height)) for i in range(count)]
+
+
+def phase_single(cards, pipeline, db):
+    stages = {}
+    totals = []
+    for _, data in cards:
+        start = time.perf_counter()
+        lead = pipeline.process_card(data, "Smart Talk", "Benchmark")
+        spans = list(lead["trace"].spans)
+        db.write(lambda conn: pipeline.save_lead(conn, lead))
+        totals.append(1000 * (time.perf_counter() - start))
+        for span in spans:
+            stages.setdefault(span.stage, []).append(span.duration_ms)
+    print("Carte seule (séquentiel)")
+    print_distribution("bout en bout", totals)
+    for stage, durations in stages.items():
+        print_distribution(stage, durations)
+
+
+def phase_batch(cards, batch, workers):
+    start = time.perf_counter()
+    results = batch.run_batch(cards, "Smart Talk", "Benchmark", max_workers=workers)
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results if r["statut"] == "ok")
+    duplicates = sum(1 for r in results if r["statut"].startswith("doublon"))
+    print(f"Lot ({workers} workers)")
+    print(f"  {len(results)} cartes en {elapsed:.1f} s : {60 * len(results) / elapsed:.1f} cartes/min "
+          f"({ok} traitées, {duplicates} doublons, {len(results) - ok - duplicates} erreurs)")
+
+
+def phase_jobs(cards, jobs, workers):
+    start = time.perf_counter()
+    job_ids = [jobs.submit_job(data, "Smart Talk", "Benchmark") for _, data in cards]
+    stop_event, threads = jobs.start_workers(workers)
+    try:
+        while True:
+            states = jobs.list_jobs(job_ids)
+            if all(job["status"] in ("done", "failed", "duplicate") for job in states):
+                break
+            time.sleep(0.05)
+    finally:
+        stop_event.set()
+    elapsed = time.perf_counter() - start
+    done = sum(1 for job in states if job["status"] == "done")
+    duplicates = sum(1 for job in states if job["status"] == "duplicate")
+    print(f"File de jobs ({workers} workers, parcours de code.py)")
+    print(f"  {len(job_ids)} jobs en {elapsed:.1f} s : {60 * len(job_ids) / elapsed:.1f} cartes/min "
+          f"({done} terminés, {duplicates} doublons en attente, {len(job_ids) - done - duplicates} échecs)")
+
+
+def phase_db(pipeline, db, threads, per_thread):
+    template = {column: f"valeur {column}" for column in pipeline.LEAD_COLUMNS + pipeline.TEXT_FIELDS}
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(n):
+        for i in range(per_thread):
+            lead = dict(template, mail_key=f"bench{n}.{i}@exemple.fr", telephone_key=None, image_phash=None)
+            start = time.perf_counter()
+            db.write(lambda conn: pipeline.save_lead(conn, lead))
+            with lock:
+                latencies.append(1000 * (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"Écritures ({threads} threads)")
+    print(f"  {len(latencies)} leads en {elapsed:.2f} s : {len(latencies) / elapsed:.0f} leads/s")
+    print_distribution("latence d'écriture", latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=20, help="Cartes par phase (lot et jobs)")
+    parser.add_argument("--single", type=int, default=5, help="Cartes de la phase single")
+    parser.add_argument("--phases", default=",".join(PHASES), help=f"Phases à exécuter parmi {', '.join(PHASES)}")
+    parser.add_argument("--backend", choices=("assistants", "chat"), default="assistants")
+    parser.add_argument("--workers", type=int, default=6, help="Workers du lot et de la file de jobs")
+    parser.add_argument("--image-size", default="2000x1500", help="Taille des photos synthétiques")
+    parser.add_argument("--ocr-latency", default="2.0:0.4")
+    parser.add_argument("--llm-first-token", default="0.8:0.4", help="Délai avant le premier token")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=60)
+    parser.add_argument("--llm-response-tokens", type=int, default=250)
+    parser.add_argument("--tavily-latency", default="1.5:0.5")
+    parser.add_argument("--scale", type=float, default=1.0, help="Facteur appliqué à toutes les latences")
+    parser.add_argument("--db-threads", type=int, default=8)
+    parser.add_argument("--db-writes", type=int, default=250, help="Leads écrits par thread (phase db)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+
+    directory = tempfile.mkdtemp(prefix="bench_pipeline_")
+    # Doivent être définis avant l'import du pipeline et de db.py
+    os.environ["LEADS_DB"] = os.path.join(directory, "leads.db")
+    os.environ["PIPELINE_BACKEND"] = args.backend
+    os.environ["JOB_EMBEDDED_WORKERS"] = "0"
+    os.environ["JOB_POLL_INTERVAL"] = "0.05"
+    for key in ("OPENAI_API_KEY", "MISTRAL_API_KEY", "TAVILY_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+
+    import batch
+    import db
+    import jobs
+    import pipeline
+    from fakes import FakeMistral, FakeOpenAI, FakeTavily, Latency, installed
+    from rate_limit import limiters
+
+    width, height = (int(v) for v in args.image_size.split("x"))
+    mistral = FakeMistral(Latency.parse(args.ocr_latency, args.scale, args.seed))
+    openai = FakeOpenAI(
+        Latency.parse(args.llm_first_token, args.scale, args.seed + 1),
+        tokens_per_second=args.llm_tokens_per_s / args.scale if args.scale > 0 else 0,
+        response_tokens=args.llm_response_tokens,
+        agents=(pipeline.extraction_agent, pipeline.product_agent, pipeline.email_agent),
+    )
+    tavily = FakeTavily(Latency.parse(args.tavily_latency, args.scale, args.seed + 2))
+
+    print(f"Base temporaire : {os.environ['LEADS_DB']}   backend : {args.backend}   échelle des latences : {args.scale}")
+    print("Limiteurs : " + ", ".join(
+        f"{name} {limiter.max_concurrency} simultanés / {limiter.rate_per_minute:.0f} par min"
+        for name, limiter in limiters.items()))
+    print()
+
+    with installed(pipeline, mistral, openai, tavily):
+        # Un corpus distinct par phase : ni le cache OCR ni la détection des doublons ne faussent les mesures
+        if "single" in phases:
+            phase_single(corpus(args.single, args.seed + 100, width, height), pipeline, db)
+        if "batch" in phases:
+            phase_batch(corpus(args.cards, args.seed + 200, width, height), batch, args.workers)
+        if "jobs" in phases:
+            phase_jobs(corpus(args.cards, args.seed + 300, width, height), jobs, args.workers)
+        if "db" in phases:
+            phase_db(pipeline, db, args.db_threads, args.db_writes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Gains de la migration 8 (textes longs compressés dans `lead_texts`).
+
+Crée une base temporaire au schéma 7 (textes OCR et agents dans la ligne
+`leads`), la remplit de leads synthétiques aux textes réalistes (l'agent 2
+reprend le catalogue produits, l'agent 3 le même modèle de mail), mesure,
+applique la migration 8 puis mesure à nouveau, fichier compacté (VACUUM)
+dans les deux cas :
+- taille du fichier et des textes ;
+- parcours complet de la liste (colonnes courtes, filtre non indexé) ;
+- recherche des doublons par mail ;
+- lecture du détail de leads tirés au hasard (décompression comprise).
+
+    python benchmarks/bench_text_store.py --leads 5000
+    TEXT_CODEC=zlib python benchmarks/bench_text_store.py
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import COMPANIES, TITLES, card_text
+from migrations import MIGRATIONS, migrate
+from text_store import TEXT_FIELDS, _codec, print_report, storage_report
+
+PRODUCTS = [
+    ("Smart Talk", "un assistant conversationnel entraîné sur la documentation interne, qui répond aux questions "
+                   "des collaborateurs et des clients, s'intègre à Teams, Slack ou au site web et cite ses sources"),
+    ("Smart Doc", "l'extraction automatique des informations clés des contrats, factures et bons de commande, "
+                  "avec validation humaine et export vers l'ERP"),
+    ("Smart Voice", "la transcription et le résumé des appels et des réunions, avec détection des actions à mener "
+                    "et synchronisation dans le CRM"),
+    ("Audit IA", "un audit de deux semaines pour identifier les cas d'usage à fort retour sur investissement, "
+                 "chiffrer les gains et établir une feuille de route"),
+    ("Formation", "des formations de une à trois journées pour les équipes métier et techniques, de la découverte "
+                  "de l'IA générative à la mise en production"),
+    ("Smart Search", "un moteur de recherche sémantique sur l'ensemble des documents de l'entreprise, avec "
+                     "gestion des droits d'accès existants"),
+]
+SECTORS = ["l'industrie", "la distribution", "les services financiers", "la santé", "le conseil", "la logistique",
+           "l'énergie", "le secteur public"]
+FACTS = [
+    "L'entreprise a annoncé une levée de fonds de {n} millions d'euros pour accélérer son développement.",
+    "Elle compte environ {n}0 collaborateurs répartis sur plusieurs sites en France.",
+    "Elle a récemment ouvert un bureau à {city} et recrute des profils data.",
+    "Son dirigeant est intervenu au salon VivaTech sur la transformation numérique du secteur.",
+    "Elle a remporté en {year} un prix de l'innovation pour sa plateforme client.",
+    "Le site web met en avant une démarche RSE et des engagements de réduction carbone.",
+    "Elle travaille avec de grands comptes de {sector} et se développe à l'international.",
+]
+CITIES = ["Lyon", "Nantes", "Bordeaux", "Lille", "Toulouse", "Marseille", "Rennes", "Strasbourg"]
+
+
+def lead_texts(rng, seed):
+    """Textes OCR et agents 1 à 3 d'un lead synthétique."""
+    ocr = card_text(seed)
+    name = ocr.splitlines()[0].lstrip("# ")
+    prenom, nom = name.split(" ", 1)
+    company = rng.choice(COMPANIES)
+    sector = rng.choice(SECTORS)
+    facts = " ".join(rng.choice(FACTS).format(n=rng.randint(2, 90), city=rng.choice(CITIES), year=rng.randint(2018, 2024),
+                                              sector=sector) for _ in range(rng.randint(3, 6)))
+    agent1 = (f"Nom: {nom}\nPrénom: {prenom}\nPoste: {rng.choice(TITLES)}\nEntreprise: {company}\n"
+              f"Secteur: {sector}\n\nRecherche :\n{facts}")
+    chosen = rng.sample(PRODUCTS, rng.randint(2, 4))
+    agent2 = (f"Pour {company}, acteur de {sector}, les offres les plus pertinentes sont :\n\n" + "\n\n".join(
+        f"- **{product}** : {description}. Pertinence : {rng.randint(60, 98)} %." for product, description in chosen
+    ) + "\n\nNous recommandons de commencer par " + chosen[0][0] + " pour un premier résultat rapide.")
+    agent3 = (f"Objet : Suite à notre rencontre\n\nBonjour {prenom},\n\nJ'ai été ravi d'échanger avec vous lors du "
+              f"salon. Comme évoqué, {company} pourrait tirer parti de " + " et de ".join(p for p, _ in chosen[:2])
+              + f" pour gagner du temps au quotidien. Je vous propose un rendez-vous de trente minutes la semaine "
+              f"prochaine pour vous présenter une démonstration adaptée à {sector}.\n\nBien cordialement,\n"
+              f"L'équipe commerciale")
+    return ocr, prenom, nom, agent1, agent2, agent3
+
+
+def build(path, count, seed):
+    """Base au schéma 7 remplie de count leads."""
+    db = sqlite3.connect(path, isolation_level=None)
+    for number, migration in enumerate(MIGRATIONS[:7], 1):
+        migration(db)
+        db.execute(f"PRAGMA user_version = {number}")
+    rng = random.Random(seed)
+    db.execute("BEGIN")
+    for i in range(count):
+        ocr, prenom, nom, agent1, agent2, agent3 = lead_texts(rng, seed * 100000 + i)
+        mail = f"{prenom.lower()}.{nom.lower()}.{i}@exemple.fr"
+        db.execute(
+            "INSERT INTO leads (ocr_text, nom, prenom, telephone, mail, agent1, agent2, agent3, qualification, note, "
+            "mail_key, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', ?))",
+            (ocr, nom, prenom, "0123456789", mail, agent1, agent2, agent3, "Smart Talk", "Salon", mail,
+             f"-{count - i} minutes")
+        )
+    db.execute("COMMIT")
+    return db
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(1000 * (time.perf_counter() - start))
+    return min(timings)
+
+
+def measure(db, source, count, repeat, seed):
+    """Mesures communes aux deux schémas ; source est la table (ou vue) portant les textes."""
+    db.execute("VACUUM")
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    rng = random.Random(seed)
+    ids = [rng.randint(1, count) for _ in range(200)]
+    mails = [db.execute("SELECT mail_key FROM leads WHERE id = ?", (i,)).fetchone()[0] for i in ids]
+    return {
+        "Fichier (Ko)": page_size * db.execute("PRAGMA page_count").fetchone()[0] / 1024,
+        "Parcours liste (ms)": best_of(repeat, lambda: db.execute(
+            "SELECT id, nom, prenom, telephone, mail, qualification, timestamp FROM leads WHERE note LIKE '%zzz%'"
+        ).fetchall()),
+        "200 doublons mail (ms)": best_of(repeat, lambda: [db.execute(
+            "SELECT MAX(id) FROM leads WHERE mail_key = ?", (mail,)).fetchone() for mail in mails]),
+        "200 détails (ms)": best_of(repeat, lambda: [db.execute(
+            f"SELECT nom, {', '.join(TEXT_FIELDS)} FROM {source} WHERE id = ?", (i,)).fetchone() for i in ids]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="Répétitions de chaque mesure (la meilleure est gardée)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_text_store_"), "leads.db")
+    db = build(path, args.leads, args.seed)
+    before = measure(db, "leads", args.leads, args.repeat, args.seed)
+
+    start = time.perf_counter()
+    migrate(db)
+    migration_s = time.perf_counter() - start
+    after = measure(db, "leads_full", args.leads, args.repeat, args.seed)
+
+    print(f"{args.leads} leads, codec {_codec()}, migration en {migration_s:.1f} s ({path})")
+    print(f"  {'':24s} {'schéma 7':>12s} {'schéma 8':>12s} {'gain':>8s}")
+    for name in before:
+        gain = before[name] / after[name] if after[name] else float("inf")
+        print(f"  {name:24s} {before[name]:12.1f} {after[name]:12.1f} {gain:7.1f}x")
+    print()
+    print_report(storage_report(db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Doublures en mémoire de Mistral OCR, de l'API OpenAI et de Tavily.
+
+Elles reproduisent les formes de réponse utilisées par le pipeline
+(pages markdown de l'OCR, cycle thread / run / requires_action en
+streaming des assistants, chat completions en streaming avec appels
+d'outils et consommation de tokens, get_search_context) avec des latences
+tirées de distributions log-normales configurables. Aucun accès réseau.
+"""
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace as NS
+
+from contact_extractor import best_fields, extract_contacts
+
+FIRST_NAMES = ["Jean", "Marie", "Louis", "Camille", "Hugo", "Léa", "Nicolas", "Sophie", "Karim", "Inès", "Thomas", "Julie"]
+LAST_NAMES = ["MARTIN", "BERNARD", "DUBOIS", "DURAND", "LEROY", "MOREAU", "SIMON", "LAURENT", "MICHEL", "GARCIA", "ROUX", "FOURNIER"]
+COMPANIES = ["Acme Conseil", "Datalis", "Nova Industrie", "Orbital SAS", "Quantix", "Verdi Groupe", "Helios Tech", "Atelier Lumen"]
+TITLES = ["Directeur commercial", "Responsable innovation", "CTO", "Chargée de projets", "Fondatrice", "Head of Data"]
+WORDS = ("notre offre accompagne les équipes dans la mise en place de solutions d'intelligence artificielle "
+         "adaptées à leurs besoins avec des formations des audits et des modules sur mesure").split()
+
+
+class Latency:
+    """Latence log-normale : médiane (en secondes) et dispersion sigma, multipliées par scale."""
+
+    def __init__(self, median, sigma=0.3, scale=1.0, seed=0):
+        self.median = median
+        self.sigma = sigma
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, scale=1.0, seed=0):
+        """"1.5" ou "1.5:0.4" -> Latency(1.5, 0.4)."""
+        median, _, sigma = spec.partition(":")
+        return cls(float(median), float(sigma) if sigma else 0.3, scale, seed)
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        with self._lock:
+            noise = self._rng.gauss(0, self.sigma)
+        return self.scale * self.median * math.exp(noise)
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+
+def card_text(seed):
+    """Texte OCR (markdown) d'une carte de visite fictive, déterministe pour une graine donnée."""
+    rng = random.Random(seed)
+    prenom, nom = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    company = rng.choice(COMPANIES)
+    domain = re.sub(r"[^a-z]", "", company.lower()) + ".fr"
+    local = re.sub(r"[^a-z]", "", prenom.lower().replace("é", "e").replace("è", "e"))
+    phone = "0" + str(rng.randint(1, 7)) + "".join(f" {rng.randint(0, 99):02d}" for _ in range(4))
+    return (
+        f"# {prenom} {nom}\n{rng.choice(TITLES)}\n**{company}**\n"
+        f"Tél : {phone}\n{local}.{nom.lower()}.{seed % 1000}@{domain}\nwww.{domain}"
+    )
+
+
+def filler(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _seed(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+##############################
+# Mistral OCR                #
+##############################
+class FakeMistral:
+    """client.ocr.process(model, document) -> réponse à pages markdown, comme mistral-ocr-latest."""
+
+    def __init__(self, latency):
+        self.ocr = NS(process=self._process)
+        self._latency = latency
+
+    def _process(self, model, document):
+        data_uri = document["image_url"]
+        self._latency.sleep()
+        # Image sans contenu : l'OCR ne trouve rien
+        if data_uri.endswith(","):
+            return NS(pages=[NS(markdown="")])
+        return NS(pages=[NS(markdown=card_text(_seed(data_uri)))])
+
+
+##############################
+# Tavily                     #
+##############################
+class FakeTavily:
+    """get_search_context(query, ...) -> contexte JSON d'environ result_chars caractères."""
+
+    def __init__(self, latency, result_chars=6000):
+        self._latency = latency
+        self._result_chars = result_chars
+
+    def get_search_context(self, query, search_depth="basic", max_tokens=4000):
+        self._latency.sleep()
+        rng = random.Random(_seed(query))
+        results = []
+        while sum(len(r["content"]) for r in results) < self._result_chars:
+            results.append({"url": f"https://exemple.fr/{len(results)}", "content": filler(rng, 60)})
+        return json.dumps(results, ensure_ascii=False)
+
+
+##############################
+# OpenAI                     #
+##############################
+class _LLM:
+    """Génère les réponses des trois agents et simule le streaming (premier token puis débit constant)."""
+
+    def __init__(self, first_token, tokens_per_second, response_tokens, chunk_tokens=8):
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+
+    def response(self, agent, user_message):
+        rng = random.Random(_seed(user_message))
+        if agent == "extraction":
+            fields, _ = best_fields(extract_contacts(user_message))
+            header = (f"Nom: {fields['nom']}\nPrénom: {fields['prenom']}\nTéléphone: {fields['telephone']}\n"
+                      f"Mail: {fields['mail']}\nEntreprise: {rng.choice(COMPANIES)}\n\n")
+            return header + filler(rng, self.response_tokens)
+        if agent == "mail":
+            return "Bonjour,\n\n" + filler(rng, self.response_tokens) + "\n\nCordialement"
+        return filler(rng, self.response_tokens)
+
+    def chunks(self, text):
+        """Découpe le texte en fragments en respectant le débit simulé."""
+        self.first_token.sleep()
+        words = text.split(" ")
+        delay = self.chunk_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for start in range(0, len(words), self.chunk_tokens):
+            if start:
+                time.sleep(delay)
+            piece = " ".join(words[start:start + self.chunk_tokens])
+            yield piece if start == 0 else " " + piece
+
+    @staticmethod
+    def tokens(text):
+        return max(1, len(text) // 4)
+
+
+def _tool_query(user_message):
+    fields, _ = best_fields(extract_contacts(user_message))
+    return " ".join(v for v in (fields["prenom"], fields["nom"], fields["mail"].split("@")[-1]) if v) or "entreprise"
+
+
+class _Stream:
+    """Gestionnaire de contexte itérable, comme AssistantStreamManager."""
+
+    def __init__(self, events):
+        self._events = events
+
+    def __enter__(self):
+        return self._events
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeAssistants:
+    """Sous-ensemble de client.beta : assistants, threads.create_and_run_stream et runs.*_stream."""
+
+    def __init__(self, llm):
+        self._llm = llm
+        self._ids = itertools.count(1)
+        self._assistants = {}
+        self._runs = {}
+        self._lock = threading.Lock()
+        self.assistants = NS(create=self._create_assistant, delete=lambda assistant_id: None)
+        self.threads = NS(
+            create_and_run_stream=self._create_and_run_stream,
+            runs=NS(submit_tool_outputs_stream=self._submit_tool_outputs_stream, cancel=lambda **kwargs: None),
+        )
+
+    def _next_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def _create_assistant(self, name, instructions, model, tools=None):
+        assistant_id = self._next_id("asst")
+        self._assistants[assistant_id] = {"name": name, "tools": tools or []}
+        return NS(id=assistant_id)
+
+    def _create_and_run_stream(self, assistant_id, thread, timeout=None):
+        assistant = self._assistants[assistant_id]
+        run = {
+            "thread_id": self._next_id("thread"), "id": self._next_id("run"), "agent": assistant["name"],
+            "message": thread["messages"][0]["content"], "tools": assistant["tools"], "tool_rounds": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        }
+        self._runs[run["id"]] = run
+        return _Stream(self._events(run, created=True))
+
+    def _submit_tool_outputs_stream(self, thread_id, run_id, tool_outputs, timeout=None):
+        run = self._runs[run_id]
+        run["message"] += "\n" + "\n".join(o["output"] for o in tool_outputs)
+        return _Stream(self._events(run, created=False))
+
+    def _events(self, run, created):
+        if created:
+            yield NS(event="thread.run.created", data=NS(id=run["id"], thread_id=run["thread_id"]))
+        run["prompt_tokens"] += _LLM.tokens(run["message"])
+        # L'assistant d'extraction demande une recherche au premier tour
+        if run["tools"] and run["tool_rounds"] == 0:
+            run["tool_rounds"] += 1
+            self._llm.first_token.sleep()
+            call = NS(id=self._next_id("call"), function=NS(
+                name="tavily_search", arguments=json.dumps({"query": _tool_query(run["message"])})))
+            yield NS(event="thread.run.requires_action", data=NS(
+                status="requires_action",
+                required_action=NS(submit_tool_outputs=NS(tool_calls=[call]))))
+            return
+        text = self._llm.response(run["agent"], run["message"])
+        yield NS(event="thread.message.created", data=NS())
+        for piece in self._llm.chunks(text):
+            yield NS(event="thread.message.delta", data=NS(delta=NS(content=[NS(type="text", text=NS(value=piece))])))
+        run["completion_tokens"] += _LLM.tokens(text)
+        del self._runs[run["id"]]
+        yield NS(event="thread.run.completed", data=NS(
+            status="completed", last_error=None,
+            usage=NS(prompt_tokens=run["prompt_tokens"], completion_tokens=run["completion_tokens"])))
+
+
+class FakeChatCompletions:
+    """client.chat.completions.create(stream=True) avec appels d'outils et chunk final de consommation."""
+
+    def __init__(self, llm, agents):
+        self._llm = llm
+        # Les instructions système identifient l'agent
+        self._agents = {agent["instructions"]: agent["name"] for agent in agents}
+        self._ids = itertools.count(1)
+
+    def create(self, messages, model, stream=True, tools=None, timeout=None, stream_options=None):
+        agent = self._agents.get(messages[0]["content"], "produits")
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        usage = NS(prompt_tokens=_LLM.tokens(prompt), completion_tokens=0)
+        if tools and not any(m["role"] == "tool" for m in messages):
+            self._llm.first_token.sleep()
+            arguments = json.dumps({"query": _tool_query(messages[1]["content"])})
+            call = NS(index=0, id=f"call_{next(self._ids)}", function=NS(name="tavily_search", arguments=arguments))
+            chunks = [
+                NS(choices=[NS(delta=NS(content=None, tool_calls=[call]), finish_reason=None)], usage=None),
+                NS(choices=[NS(delta=NS(content=None, tool_calls=None), finish_reason="tool_calls")], usage=None),
+            ]
+            usage.completion_tokens = 20
+            return iter(chunks + [NS(choices=[], usage=usage)])
+        return self._stream_text(self._llm.response(agent, prompt), usage)
+
+    def _stream_text(self, text, usage):
+        for piece in self._llm.chunks(text):
+            yield NS(choices=[NS(delta=NS(content=piece, tool_calls=None), finish_reason=None)], usage=None)
+        yield NS(choices=[NS(delta=NS(content=None, tool_calls=None), finish_reason="stop")], usage=None)
+        usage.completion_tokens = _LLM.tokens(text)
+        yield NS(choices=[], usage=usage)
+
+
+class FakeOpenAI:
+    """Client OpenAI factice : client.beta (assistants) et client.chat.completions."""
+
+    def __init__(self, first_token, tokens_per_second=60, response_tokens=250, agents=()):
+        llm = _LLM(first_token, tokens_per_second, response_tokens)
+        self.beta = FakeAssistants(llm)
+        self.chat = NS(completions=FakeChatCompletions(llm, agents))
+
+
+@contextmanager
+def installed(pipeline, mistral, openai, tavily):
+    """Remplace temporairement les clients du module pipeline par les doublures."""
+    saved = (pipeline.client_mistral, pipeline.client_openai, pipeline.tavily_client)
+    pipeline.client_mistral, pipeline.client_openai, pipeline.tavily_client = mistral, openai, tavily
+    try:
+        yield
+    finally:
+        pipeline.client_mistral, pipeline.client_openai, pipeline.tavily_client = saved
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Backend d'exécution des agents via l'API chat completions.
+
+Chaque agent tient en un seul appel `chat.completions.create` (plus un appel
+par tour d'outils) au lieu de la séquence thread / message / run / lecture
+des messages de l'API Assistants. Les instructions de l'assistant servent de
+message système, et les appels à `tavily_search` sont exécutés en ligne.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+from openai import APITimeoutError
+
+from metrics import record
+from run_engine import RUN_TIMEOUT, RunError, RunTimeoutError
+
+# Nombre maximal de tours d'appels d'outils avant d'abandonner
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", "5"))
+
+
+def _read_stream(stream, text, on_text):
+    """Accumule le texte et les appels d'outils d'une réponse en streaming."""
+    tool_calls = {}
+    finish_reason = None
+    for chunk in stream:
+        # Dernier fragment (stream_options include_usage) : consommation de l'appel, sans choix
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            record(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta.content:
+            text += delta.content
+            if on_text:
+                on_text(text)
+        for call in delta.tool_calls or []:
+            entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+            if call.id:
+                entry["id"] = call.id
+            if call.function and call.function.name:
+                entry["name"] += call.function.name
+            if call.function and call.function.arguments:
+                entry["arguments"] += call.function.arguments
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+    return text, [tool_calls[i] for i in sorted(tool_calls)], finish_reason
+
+
+def stream_chat(client, instructions, user_message, model, tools=None, tool_handler=None, on_text=None, timeout=None):
+    """
+    Exécute un agent en un appel chat completion et retourne son texte final.
+
+    tool_handler et on_text ont la même signature que pour
+    run_engine.stream_run, ce qui rend les deux backends interchangeables.
+    """
+    timeout = timeout or RUN_TIMEOUT
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": user_message},
+    ]
+    deadline = time.monotonic() + timeout
+    params = {"model": model, "stream": True, "stream_options": {"include_usage": True}}
+    if tools:
+        params["tools"] = tools
+
+    text = ""
+    try:
+        for _ in range(MAX_TOOL_ROUNDS + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RunTimeoutError(timeout)
+            stream = client.chat.completions.create(messages=messages, timeout=remaining, **params)
+            record(rounds=1)
+            text, calls, finish_reason = _read_stream(stream, text, on_text)
+            if finish_reason != "tool_calls" or not calls:
+                if finish_reason not in (None, "stop", "tool_calls"):
+                    raise RunError(finish_reason)
+                return text.strip()
+            if tool_handler is None:
+                raise RunError("requires_action", "aucun gestionnaire d'outils fourni")
+
+            messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+                    for c in calls
+                ],
+            })
+            # Même forme d'objet que les tool_calls de l'API Assistants
+            tool_objects = [
+                SimpleNamespace(id=c["id"], function=SimpleNamespace(name=c["name"], arguments=c["arguments"]))
+                for c in calls
+            ]
+            outputs = {o["tool_call_id"]: o["output"] for o in tool_handler(tool_objects)}
+            for c in calls:
+                messages.append({"role": "tool", "tool_call_id": c["id"], "content": outputs.get(c["id"], "")})
+    except APITimeoutError:
+        raise RunTimeoutError(timeout)
+    raise RunError("incomplete", f"plus de {MAX_TOOL_ROUNDS} tours d'appels d'outils")
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction locale et déterministe des coordonnées à partir du texte OCR.
+
+Emails, numéros de téléphone, sites web / domaines et candidats pour le nom
+sont repérés par expressions régulières et heuristiques, chacun avec un
+score de confiance entre 0 et 1. Le résultat pré-remplit les champs du lead
+et donne à l'assistant 1 une entrée structurée et compacte.
+"""
+import os
+import re
+import unicodedata
+
+# Au-dessus de ce score, un champ est considéré comme fiable sans l'assistant 1
+LOCAL_EXTRACTION_THRESHOLD = float(os.getenv("LOCAL_EXTRACTION_THRESHOLD", "0.85"))
+# Écart de confiance minimal avec le candidat suivant pour qu'un champ soit considéré comme fiable
+LOCAL_EXTRACTION_MARGIN = float(os.getenv("LOCAL_EXTRACTION_MARGIN", "0.1"))
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?:(?:\+|00)\d{1,3}[\s.\-]?(?:\(0\)[\s.\-]?)?)?\(?\d{1,4}\)?(?:[\s.\-]?\d{2,4}){2,5}")
+URL_RE = re.compile(r"(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)*\.[A-Za-z]{2,}(?:/[^\s]*)?", re.IGNORECASE)
+PHONE_LABEL_RE = re.compile(r"\b(t[ée]l|tel|phone|mobile|mob|portable|gsm|ligne directe)\b", re.IGNORECASE)
+FAX_LABEL_RE = re.compile(r"\bfax\b", re.IGNORECASE)
+# Standard ou accueil de l'entreprise : numéro joignable, mais pas celui du contact
+SWITCHBOARD_LABEL_RE = re.compile(r"\b(standard|accueil|switchboard|r[ée]ception|si[èe]ge)\b", re.IGNORECASE)
+MOBILE_RE = re.compile(r"(?:\+33|0)[67]\d{8}")
+COMPANY_HINTS = {
+    "sas", "sarl", "sa", "sasu", "eurl", "inc", "ltd", "llc", "gmbh", "group", "groupe",
+    "consulting", "conseil", "solutions", "services", "technologies", "agence", "cabinet",
+}
+TITLE_HINTS = {
+    "directeur", "directrice", "manager", "responsable", "ceo", "cto", "cfo", "coo", "président",
+    "présidente", "fondateur", "fondatrice", "founder", "head", "chef", "ingénieur", "consultant",
+    "consultante", "chargé", "chargée", "commercial", "commerciale", "gérant", "gérante", "associé",
+    "associée", "partner", "développeur", "developer", "engineer", "sales", "marketing", "rue",
+    "avenue", "boulevard", "bd", "cedex",
+}
+WEBMAIL_DOMAINS = {"gmail.com", "yahoo.fr", "yahoo.com", "hotmail.com", "hotmail.fr", "outlook.com", "orange.fr", "free.fr", "icloud.com", "wanadoo.fr", "laposte.net"}
+
+
+def _strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def _clean_lines(ocr_text):
+    lines = []
+    for line in ocr_text.splitlines():
+        # Le markdown de l'OCR peut contenir des titres, du gras, des puces ou des tableaux
+        line = re.sub(r"[#*_>|`]+", " ", line)
+        line = re.sub(r"^\s*[-•]\s*", "", line)
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    return lines
+
+
+def extract_emails(lines):
+    emails = {}
+    for line in lines:
+        for match in EMAIL_RE.findall(line):
+            email = match.strip(".").lower()
+            confidence = 0.97 if re.search(r"\.[a-z]{2,6}$", email) else 0.7
+            emails[email] = max(emails.get(email, 0), confidence)
+    return sorted(emails.items(), key=lambda item: -item[1])
+
+
+def normalize_phone(raw):
+    """Normalise un numéro : +33 1 23 45 67 89 -> +33123456789, 01 23 45 67 89 -> 0123456789."""
+    raw = raw.replace("(0)", "")
+    digits = re.sub(r"\D", "", raw)
+    if raw.strip().startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    return digits
+
+
+def mail_key(mail):
+    """Clé de comparaison d'un email (casse et espaces ignorés)."""
+    return (mail or "").strip().lower()
+
+
+def name_key(nom):
+    """Clé de comparaison d'un nom de famille (accents, casse et espaces ignorés)."""
+    return " ".join(_strip_accents(nom or "").lower().split())
+
+
+def phone_key(telephone):
+    """Clé de comparaison d'un numéro : ses 9 derniers chiffres (+33 1 23... et 01 23... se confondent)."""
+    digits = normalize_phone(telephone or "").lstrip("+")
+    return digits[-9:] if len(digits) >= 9 else ""
+
+
+def extract_phones(lines):
+    phones = {}
+    for line in lines:
+        if EMAIL_RE.search(line) and not PHONE_LABEL_RE.search(line):
+            line = EMAIL_RE.sub(" ", line)
+        for match in PHONE_RE.finditer(line):
+            phone = normalize_phone(match.group(0))
+            digits = phone.lstrip("+")
+            if not 9 <= len(digits) <= 15:
+                continue
+            # Un mobile est le plus souvent la ligne du contact, une ligne fixe peut être celle de l'entreprise
+            if MOBILE_RE.fullmatch(phone):
+                confidence = 0.92
+            elif phone.startswith("+") or re.fullmatch(r"0[1-9]\d{8}", phone):
+                confidence = 0.86
+            else:
+                confidence = 0.6
+            if PHONE_LABEL_RE.search(line):
+                confidence = min(1.0, confidence + 0.05)
+            if SWITCHBOARD_LABEL_RE.search(line):
+                confidence -= 0.25
+            if FAX_LABEL_RE.search(line):
+                confidence -= 0.4
+            phones[phone] = max(phones.get(phone, 0), round(confidence, 2))
+    return sorted(phones.items(), key=lambda item: -item[1])
+
+
+def extract_urls(lines, emails):
+    urls = {}
+    for line in lines:
+        line = EMAIL_RE.sub(" ", line)
+        for match in URL_RE.findall(line):
+            url = match.rstrip(".,;").lower()
+            domain = re.sub(r"^(?:https?://)?(?:www\.)?", "", url).split("/")[0]
+            if re.fullmatch(r"[\d.]+", domain):
+                continue
+            explicit = url.startswith(("http", "www."))
+            urls[domain] = max(urls.get(domain, 0), 0.95 if explicit else 0.7)
+    # Le domaine d'une adresse professionnelle est aussi le site de l'entreprise
+    for email, confidence in emails:
+        domain = email.split("@")[1]
+        if domain not in WEBMAIL_DOMAINS:
+            urls[domain] = max(urls.get(domain, 0), 0.8 * confidence)
+    return sorted(urls.items(), key=lambda item: -item[1])
+
+
+def _split_name(tokens):
+    """Sépare prénom et nom : un mot en majuscules est le nom, sinon le premier mot est le prénom."""
+    upper = [t for t in tokens if t.isupper() and len(t) > 1]
+    if upper and len(upper) < len(tokens):
+        return " ".join(t for t in tokens if t not in upper), " ".join(upper)
+    return tokens[0], " ".join(tokens[1:])
+
+
+def extract_names(lines, emails):
+    local_parts = [_strip_accents(email.split("@")[0]).lower() for email, _ in emails]
+    candidates = []
+    for index, line in enumerate(lines):
+        if any(c.isdigit() for c in line) or "@" in line or URL_RE.fullmatch(line):
+            continue
+        tokens = line.replace(",", " ").split()
+        if not 2 <= len(tokens) <= 4:
+            continue
+        if not all(re.fullmatch(r"[A-ZÀ-Ý][A-Za-zÀ-ÿ'\-]*\.?", t) for t in tokens):
+            continue
+        lowered = {t.lower().strip(".") for t in tokens}
+        if lowered & COMPANY_HINTS or lowered & TITLE_HINTS:
+            continue
+        prenom, nom = _split_name(tokens)
+        confidence = 0.5 - 0.03 * index
+        plain = [_strip_accents(t).lower() for t in tokens]
+        for local in local_parts:
+            hits = sum(1 for t in plain if len(t) > 1 and t in local)
+            if hits >= 2:
+                confidence = 0.95
+            elif hits == 1 or (local and local[0] == plain[0][0] and plain[-1] in local):
+                confidence = max(confidence, 0.8)
+        candidates.append({"prenom": prenom, "nom": nom, "confidence": round(max(confidence, 0.1), 2)})
+    return sorted(candidates, key=lambda c: -c["confidence"])
+
+
+def extract_contacts(ocr_text):
+    """
+    Retourne {"emails": [(valeur, confiance)], "phones": [...], "urls": [...],
+    "names": [{"prenom", "nom", "confidence"}]}, chaque liste triée par
+    confiance décroissante.
+    """
+    lines = _clean_lines(ocr_text or "")
+    emails = extract_emails(lines)
+    return {
+        "emails": emails,
+        "phones": extract_phones(lines),
+        "urls": extract_urls(lines, emails),
+        "names": extract_names(lines, emails),
+    }
+
+
+def _unambiguous(scores, threshold):
+    """
+    Confiance du meilleur candidat, ramenée sous le seuil si un autre
+    candidat est presque aussi sûr : le choix revient alors à l'assistant 1.
+    """
+    if len(scores) > 1 and scores[0] - scores[1] < LOCAL_EXTRACTION_MARGIN:
+        return min(scores[0], round(threshold - 0.01, 2))
+    return scores[0]
+
+
+def best_fields(contacts, threshold=None):
+    """
+    Meilleure valeur de chaque champ du lead, au format de
+    parse_agent1_response, avec la confiance associée à chaque champ.
+    """
+    threshold = LOCAL_EXTRACTION_THRESHOLD if threshold is None else threshold
+    fields = {"nom": "", "prenom": "", "telephone": "", "mail": ""}
+    confidence = {"nom": 0.0, "prenom": 0.0, "telephone": 0.0, "mail": 0.0}
+    if contacts["names"]:
+        best = contacts["names"][0]
+        fields["nom"], fields["prenom"] = best["nom"], best["prenom"]
+        confidence["nom"] = confidence["prenom"] = _unambiguous([c["confidence"] for c in contacts["names"]], threshold)
+    if contacts["phones"]:
+        fields["telephone"] = contacts["phones"][0][0]
+        # Le même numéro peut apparaître sous deux formes (+33 1... et 01...) : ce n'est pas un concurrent
+        distinct = {}
+        for phone, score in contacts["phones"]:
+            distinct.setdefault(phone_key(phone) or phone, score)
+        confidence["telephone"] = _unambiguous(list(distinct.values()), threshold)
+    if contacts["emails"]:
+        fields["mail"] = contacts["emails"][0][0]
+        confidence["mail"] = _unambiguous([score for _, score in contacts["emails"]], threshold)
+    return fields, confidence
+
+
+def is_confident(confidence, threshold=None):
+    """Vrai si tous les champs dépassent le seuil de confiance."""
+    threshold = LOCAL_EXTRACTION_THRESHOLD if threshold is None else threshold
+    return all(value >= threshold for value in confidence.values())
+
+
+def merge_fields(local_fields, local_confidence, agent_fields, threshold=None):
+    """
+    Combine les champs locaux et ceux de l'assistant 1 : un champ local fiable
+    est conservé, sinon la valeur de l'assistant est préférée si elle existe.
+    """
+    threshold = LOCAL_EXTRACTION_THRESHOLD if threshold is None else threshold
+    merged = {}
+    for key, value in local_fields.items():
+        if local_confidence[key] >= threshold or not agent_fields.get(key):
+            merged[key] = value or agent_fields.get(key, "")
+        else:
+            merged[key] = agent_fields[key]
+    return merged
+
+
+def format_contacts(fields, contacts):
+    """Résumé structuré et compact des champs détectés, destiné à l'assistant 1."""
+    lines = [
+        f"Nom: {fields['nom']}",
+        f"Prénom: {fields['prenom']}",
+        f"Téléphone: {fields['telephone']}",
+        f"Mail: {fields['mail']}",
+    ]
+    others = [phone for phone, _ in contacts["phones"]
+              if phone_key(phone) != phone_key(fields["telephone"])][:2]
+    if others:
+        lines.append("Autres numéros: " + ", ".join(others))
+    if contacts["urls"]:
+        lines.append("Site: " + ", ".join(url for url, _ in contacts["urls"][:2]))
+    return "\n".join(lines)
+
+
+def residual_text(ocr_text, fields):
+    """Texte OCR débarrassé des lignes déjà couvertes par les champs extraits."""
+    mail = fields["mail"].lower()
+    phone_digits = re.sub(r"\D", "", fields["telephone"])[-9:]
+    kept = []
+    for line in _clean_lines(ocr_text or ""):
+        if mail and mail in line.lower():
+            continue
+        if phone_digits and phone_digits in re.sub(r"\D", "", line):
+            continue
+        if fields["nom"] and fields["prenom"] and fields["nom"] in line and fields["prenom"] in line:
+            continue
+        kept.append(line)
+    return "\n".join(kept)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Couche d'accès à leads.db partagée par toutes les pages, les workers et le
+traitement par lot.
+
+- La base est en mode WAL : les lectures ne bloquent plus les écritures.
+- Chaque thread lit avec sa propre connexion, empruntée à un pool et rendue
+  automatiquement à la fin du thread (get_connection).
+- Toutes les écritures passent par un unique thread écrivain : les
+  opérations en attente sont regroupées dans une même transaction, ce qui
+  évite les « database is locked » et amortit le coût des commits.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future
+
+from migrations import migrate
+from text_store import register_functions
+
+DB_PATH = os.getenv("LEADS_DB", "leads.db")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+# Nombre maximal d'opérations regroupées dans une transaction d'écriture
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "200"))
+
+_pool = queue.LifoQueue()
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated = False
+
+
+def _connect():
+    """
+    Ouvre une connexion configurée (WAL, synchronous, busy_timeout, fonctions
+    de décompression des textes) ; migre le schéma au premier appel.
+    """
+    global _migrated
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    register_functions(conn)
+    if not _migrated:
+        with _migrate_lock:
+            if not _migrated:
+                migrate(conn)
+                _migrated = True
+    return conn
+
+
+class _Lease:
+    """Détenteur de la connexion d'un thread ; sa destruction rend la connexion au pool."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+def _release(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        if _pool.qsize() < DB_POOL_SIZE:
+            _pool.put(conn)
+            return
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+
+def get_connection():
+    """Connexion de lecture du thread courant (la même pour toute la durée du thread)."""
+    lease = getattr(_local, "lease", None)
+    if lease is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        lease = _Lease(conn)
+        weakref.finalize(lease, _release, conn)
+        _local.lease = lease
+    return lease.conn
+
+
+class _Writer:
+    """Thread écrivain unique : exécute les opérations par lots, une transaction par lot."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, operation):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="leads-db-writer", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def _run(self):
+        conn = _connect()
+        conn.isolation_level = None
+        while True:
+            batch = [self._queue.get()]
+            # Regroupe tout ce qui est déjà en attente, sans attendre davantage
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(conn, batch)
+
+    @staticmethod
+    def _execute(conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                # Un savepoint par opération : une erreur n'annule pas les autres
+                conn.execute("SAVEPOINT operation")
+                try:
+                    results.append((future, operation(conn), None))
+                    conn.execute("RELEASE operation")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO operation")
+                    conn.execute("RELEASE operation")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = _Writer()
+
+
+def write(operation, wait=True):
+    """
+    Exécute operation(conn) dans le thread écrivain, au sein d'une transaction.
+    Retourne son résultat (ou un Future si wait=False).
+    """
+    future = _writer.submit(operation)
+    return future.result() if wait else future
+
+
+def execute_write(sql, params=(), wait=True):
+    """Exécute une requête d'écriture ; retourne le lastrowid."""
+    return write(lambda conn: conn.execute(sql, params).lastrowid, wait=wait)
+
+
+def executemany_write(sql, seq_of_params, wait=True):
+    """Exécute une requête d'écriture pour chaque jeu de paramètres ; retourne le nombre de lignes touchées."""
+    seq_of_params = list(seq_of_params)
+    return write(lambda conn: conn.executemany(sql, seq_of_params).rowcount, wait=wait)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Détection des doublons de leads, juste après l'OCR.
+
+Une même carte peut être traitée deux fois (photo puis upload, deux
+collègues qui scannent la même personne). Avant de lancer les assistants 1
+à 3, on cherche un lead existant ayant le même email ou le même téléphone
+(colonnes normalisées et indexées), ou une photo presque identique
+(empreinte perceptuelle à faible distance de Hamming) portant le même nom.
+
+Un téléphone commun ne suffit pas quand les deux cartes portent des emails
+différents (standard d'une même entreprise), et une photo proche ne suffit
+pas seule : deux cartes d'une même entreprise partagent la mise en page.
+"""
+import os
+
+from contact_extractor import mail_key, name_key, phone_key
+from db import get_connection
+
+# Distance de Hamming maximale (sur 64 bits) entre deux empreintes de la même carte
+DUPLICATE_PHASH_DISTANCE = int(os.getenv("DUPLICATE_PHASH_DISTANCE", "6"))
+
+# Décisions possibles face à un doublon
+DUPLICATE_ACTIONS = ("reuse", "update", "process")
+
+SUMMARY_COLUMNS = ("id", "nom", "prenom", "telephone", "mail", "qualification", "timestamp")
+
+
+class DuplicateLeadError(Exception):
+    """La carte correspond à un lead existant et aucune décision n'a encore été prise."""
+
+    def __init__(self, duplicate):
+        super().__init__(f"Doublon du lead #{duplicate['id']} ({duplicate['reason']})")
+        self.duplicate = duplicate
+
+
+def hamming(left, right):
+    """Nombre de bits différents entre deux empreintes hexadécimales."""
+    return bin(int(left, 16) ^ int(right, 16)).count("1")
+
+
+def _summary(conn, lead_id, reason):
+    row = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM leads WHERE id = ?", (lead_id,)).fetchone()
+    if row is None:
+        return None
+    duplicate = dict(zip(SUMMARY_COLUMNS, row))
+    duplicate["reason"] = reason
+    return duplicate
+
+
+def find_duplicate(mail, telephone, image_phash, nom=None):
+    """
+    Retourne le lead existant le plus récent correspondant à la carte (dict
+    SUMMARY_COLUMNS + "reason" : "mail", "téléphone" ou "image"), ou None.
+    """
+    conn = get_connection()
+    card_mail = mail_key(mail)
+    if card_mail:
+        row = conn.execute("SELECT MAX(id) FROM leads WHERE mail_key = ?", (card_mail,)).fetchone()
+        if row[0] is not None:
+            return _summary(conn, row[0], "mail")
+
+    card_phone = phone_key(telephone)
+    if card_phone:
+        # Même numéro mais emails différents : deux personnes joignables au même standard
+        row = conn.execute(
+            "SELECT MAX(id) FROM leads WHERE telephone_key = ? AND (? = '' OR mail_key IS NULL)",
+            (card_phone, card_mail)
+        ).fetchone()
+        if row[0] is not None:
+            return _summary(conn, row[0], "téléphone")
+
+    card_name = name_key(nom)
+    if image_phash and card_name:
+        # Parcours de l'index seul (empreinte + rowid), sans lire les lignes de `leads`
+        close = []
+        for lead_id, other in conn.execute("SELECT id, image_phash FROM leads WHERE image_phash IS NOT NULL"):
+            distance = hamming(image_phash, other)
+            if distance <= DUPLICATE_PHASH_DISTANCE:
+                close.append((distance, -lead_id))
+        # Une photo proche ne confirme un doublon que si le nom concorde
+        for _, lead_id in sorted(close):
+            row = conn.execute("SELECT nom FROM leads WHERE id = ?", (-lead_id,)).fetchone()
+            if row and name_key(row[0]) == card_name:
+                return _summary(conn, -lead_id, "image")
+    return None
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Export des leads en CSV, JSONL ou Parquet.
+
+Les lignes sont lues par paquets de EXPORT_CHUNK_SIZE sur un curseur SQLite
+(parcours de l'index (timestamp, id), sans tri en mémoire) et écrites au fur
+et à mesure dans un flux compressé : la mémoire utilisée ne dépend pas de la
+taille de la table. Parquet nécessite le paquet optionnel pyarrow.
+
+Utilisable en ligne de commande :
+    python export.py -o leads.csv.gz --columns nom,prenom,mail --from 2024-01-01
+    python export.py --format parquet --compression zstd -o leads.parquet
+"""
+import argparse
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+
+from db import get_connection
+from leads_store import lead_filters
+from text_store import TEXT_FIELDS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+EXPORT_COLUMNS = ("id", "timestamp", "nom", "prenom", "telephone", "mail", "qualification", "note",
+                  "ocr_text", "agent1", "agent2", "agent3")
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+# Compressions proposées par format ; la première est celle par défaut
+COMPRESSIONS = {
+    "csv": ("gzip", "xz", "bz2", "none"),
+    "jsonl": ("gzip", "xz", "bz2", "none"),
+    "parquet": ("zstd", "snappy", "gzip", "none"),
+}
+_STREAM_COMPRESSORS = {
+    "gzip": lambda raw: gzip.GzipFile(fileobj=raw, mode="wb"),
+    "xz": lambda raw: lzma.LZMAFile(raw, "wb"),
+    "bz2": lambda raw: bz2.BZ2File(raw, "wb"),
+}
+_EXTENSIONS = {"gzip": ".gz", "xz": ".xz", "bz2": ".bz2"}
+
+
+def available_formats():
+    """Formats utilisables dans cet environnement (Parquet seulement si pyarrow est installé)."""
+    return tuple(f for f in EXPORT_FORMATS if f != "parquet" or pyarrow is not None)
+
+
+def default_filename(fmt, compression=None):
+    compression = compression or COMPRESSIONS[fmt][0]
+    name = f"leads.{fmt}"
+    if fmt != "parquet":
+        name += _EXTENSIONS.get(compression, "")
+    return name
+
+
+def _check_columns(columns):
+    unknown = set(columns) - set(EXPORT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {', '.join(sorted(unknown))}")
+
+
+def iter_chunks(columns=None, date_from=None, date_to=None, chunk_size=None):
+    """Génère des listes d'au plus chunk_size tuples (dans l'ordre de columns), du plus ancien au plus récent."""
+    columns = columns or EXPORT_COLUMNS
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    _check_columns(columns)
+    clauses, params = lead_filters(date_from=date_from, date_to=date_to)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    # Curseur dédié : les lignes sont produites par SQLite au fil des fetchmany
+    cursor = get_connection().cursor()
+    try:
+        # Les textes longs ne sont décompressés (vue leads_full) que s'ils sont demandés
+        source = "leads_full" if set(columns) & set(TEXT_FIELDS) else "leads"
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {source} {where}ORDER BY timestamp, id", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _write_text(raw, fmt, columns, chunks):
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    else:
+        for rows in chunks:
+            text.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+            count += len(rows)
+    text.flush()
+    # Le flux sous-jacent appartient à l'appelant : on ne le ferme pas avec le wrapper
+    text.detach()
+    return count
+
+
+def _write_parquet(raw, columns, chunks, compression):
+    schema = pyarrow.schema([(c, pyarrow.int64() if c == "id" else pyarrow.string()) for c in columns])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(raw, schema, compression=compression) as writer:
+        for rows in chunks:
+            # Un row group par paquet : seul le paquet courant est en mémoire
+            arrays = [pyarrow.array(list(values), type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def export_leads(output, fmt="csv", columns=None, date_from=None, date_to=None, compression=None, chunk_size=None):
+    """
+    Exporte les leads vers output (chemin ou flux binaire) et retourne le
+    nombre de lignes écrites. columns restreint et ordonne les colonnes ;
+    date_from / date_to bornent le `timestamp` (bornes incluses).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format inconnu : {fmt}")
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("L'export Parquet nécessite le paquet pyarrow (pip install pyarrow).")
+    compression = compression or COMPRESSIONS[fmt][0]
+    if compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"Compression {compression} non disponible pour le format {fmt}")
+    columns = tuple(columns or EXPORT_COLUMNS)
+    _check_columns(columns)
+    chunks = iter_chunks(columns, date_from, date_to, chunk_size)
+
+    raw = open(output, "wb") if isinstance(output, (str, os.PathLike)) else output
+    try:
+        if fmt == "parquet":
+            return _write_parquet(raw, columns, chunks, None if compression == "none" else compression)
+        if compression == "none":
+            return _write_text(raw, fmt, columns, chunks)
+        with _STREAM_COMPRESSORS[compression](raw) as compressed:
+            return _write_text(compressed, fmt, columns, chunks)
+    finally:
+        chunks.close()
+        if raw is not output:
+            raw.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export des leads en CSV, JSONL ou Parquet.")
+    parser.add_argument("-o", "--output", help="Fichier de sortie (« - » pour la sortie standard)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="Déduit de l'extension de --output par défaut")
+    parser.add_argument("--columns", help=f"Colonnes séparées par des virgules parmi : {', '.join(EXPORT_COLUMNS)}")
+    parser.add_argument("--from", dest="date_from", help="Date de début incluse (AAAA-MM-JJ)")
+    parser.add_argument("--to", dest="date_to", help="Date de fin incluse (AAAA-MM-JJ)")
+    parser.add_argument("--compression", help="gzip, xz, bz2 ou none (CSV/JSONL) ; zstd, snappy, gzip ou none (Parquet)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        name = (args.output or "").lower()
+        fmt = next((f for f in EXPORT_FORMATS if f".{f}" in name), "csv")
+    compression = args.compression
+    if compression is None and args.output and args.output != "-" and fmt != "parquet":
+        extension = os.path.splitext(args.output)[1]
+        compression = next((c for c, ext in _EXTENSIONS.items() if ext == extension), "none")
+    output = args.output or default_filename(fmt, compression)
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+
+    try:
+        count = export_leads(sys.stdout.buffer if output == "-" else output, fmt, columns,
+                             args.date_from, args.date_to, compression, args.chunk_size)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(str(e))
+    if output != "-":
+        print(f"{count} leads exportés dans {output}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Préparation des images avant l'envoi à Mistral OCR.
+
+Les photos de téléphone font souvent plusieurs mégaoctets : on corrige
+l'orientation EXIF, on supprime les métadonnées, on redimensionne à
+IMAGE_MAX_DIMENSION pixels au plus, on recadre éventuellement sur la carte
+et on réencode en JPEG avec le type MIME correspondant.
+"""
+import io
+import os
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1600"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_AUTO_CROP = os.getenv("IMAGE_AUTO_CROP", "0") == "1"
+
+# Part minimale de l'image que doit occuper la carte détectée pour recadrer
+MIN_CROP_RATIO = 0.2
+
+
+def sniff_mime(image_bytes):
+    """Devine le type MIME d'une image à partir de ses premiers octets."""
+    if image_bytes.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def auto_crop(image):
+    """Recadre l'image sur la carte en la détachant du fond (couleur des coins)."""
+    gray = image.convert("L").filter(ImageFilter.MedianFilter(5))
+    width, height = gray.size
+    corners = [gray.getpixel((0, 0)), gray.getpixel((width - 1, 0)),
+               gray.getpixel((0, height - 1)), gray.getpixel((width - 1, height - 1))]
+    background = Image.new("L", gray.size, sorted(corners)[len(corners) // 2])
+    mask = ImageChops.difference(gray, background).point(lambda value: 255 if value > 30 else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < MIN_CROP_RATIO * width * height:
+        return image
+    margin = int(0.02 * max(width, height))
+    return image.crop((max(0, left - margin), max(0, top - margin),
+                       min(width, right + margin), min(height, bottom + margin)))
+
+
+def perceptual_hash(image_bytes):
+    """
+    Empreinte perceptuelle (dHash 64 bits, en hexadécimal) de l'image : deux
+    photos de la même carte, même recadrées ou compressées différemment, ont
+    des empreintes proches en distance de Hamming. None si l'image est illisible.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Décodage JPEG à taille réduite : quelques millisecondes même pour une photo de 12 Mpx
+        image.draft("L", (64, 64))
+        image = ImageOps.exif_transpose(image)
+    except Exception:
+        return None
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def preprocess_image(image_bytes, max_dimension=None, crop=None):
+    """
+    Retourne (octets, type MIME) de l'image prête pour l'OCR. Si l'image ne
+    peut pas être décodée, elle est renvoyée telle quelle avec son vrai type.
+    """
+    max_dimension = max_dimension or IMAGE_MAX_DIMENSION
+    crop = IMAGE_AUTO_CROP if crop is None else crop
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        exif = image.getexif()
+        rotated = exif.get(0x0112, 1) != 1
+        image = ImageOps.exif_transpose(image)
+    except Exception:
+        return image_bytes, sniff_mime(image_bytes)
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if crop:
+        image = auto_crop(image)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    output = io.BytesIO()
+    # Aucune donnée EXIF n'est transmise : les métadonnées sont supprimées
+    image.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    processed = output.getvalue()
+    # Image déjà compacte, correctement orientée et sans métadonnées (GPS, appareil) : inutile de la dégrader
+    if len(processed) >= len(image_bytes) and not rotated and not crop and not exif:
+        return image_bytes, sniff_mime(image_bytes)
+    return processed, "image/jpeg"
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+File de traitements durable, persistée dans leads.db.
+
+L'interface ne fait que soumettre un job (image, qualification, note) puis
+afficher son état. Un ou plusieurs workers (threads du serveur Streamlit ou
+processus `python jobs.py`) exécutent les jobs :
+
+- la sortie de chaque étape (OCR, agents 1 à 3) est enregistrée dès qu'elle
+  est disponible, et un job repris ne rejoue que les étapes manquantes ;
+- un job dont le worker a disparu (bail expiré) est repris par un autre ;
+- une erreur est retentée avec un délai exponentiel, jusqu'à
+  JOB_MAX_ATTEMPTS tentatives ;
+- l'insertion du lead et le passage à l'état "done" sont faits dans la même
+  transaction, un lead n'est donc jamais inséré deux fois ; les textes d'un
+  job terminé sont alors effacés, ils se lisent sur le lead (lead_id) ;
+- une carte qui correspond à un lead existant passe à l'état "duplicate" et
+  attend la décision de l'utilisateur (resolve_duplicate) avant les
+  assistants.
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from db import execute_write, get_connection, write
+from duplicates import DUPLICATE_ACTIONS, DuplicateLeadError
+from metrics import Trace
+from pipeline import API_KEYS_MISSING, NoTextError, process_card, save_lead
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "300"))
+# Durée (en secondes) sans signe de vie au-delà de laquelle un job "running" est repris
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Workers lancés dans le processus Streamlit lui-même (0 = uniquement des workers externes)
+JOB_EMBEDDED_WORKERS = int(os.getenv("JOB_EMBEDDED_WORKERS", "2"))
+# Fréquence maximale d'enregistrement du texte partiel en streaming
+PARTIAL_FLUSH_INTERVAL = 1.0
+
+CHECKPOINT_COLUMNS = ("ocr_text", "agent1", "agent2", "agent3")
+
+
+def _as_dict(cur, row):
+    return {column[0]: value for column, value in zip(cur.description, row)}
+
+
+def submit_job(image_bytes, qualification, note):
+    """Enregistre un nouveau job et retourne son identifiant."""
+    return execute_write(
+        "INSERT INTO jobs (image, qualification, note) VALUES (?, ?, ?)",
+        (sqlite3.Binary(image_bytes), qualification, note)
+    )
+
+
+def list_jobs(job_ids=None, limit=20, status=None):
+    """Retourne l'état des jobs demandés (ou des plus récents, éventuellement d'un état donné), sans l'image."""
+    columns = ("id, status, qualification, note, ocr_text, agent1, agent2, agent3, "
+               "partial_stage, partial_text, lead_id, attempts, error, duplicate_of, duplicate_reason, "
+               "created_at, updated_at")
+    if job_ids:
+        placeholders = ", ".join("?" for _ in job_ids)
+        cur = get_connection().execute(
+            f"SELECT {columns} FROM jobs WHERE id IN ({placeholders}) ORDER BY id DESC", tuple(job_ids)
+        )
+    elif status:
+        cur = get_connection().execute(
+            f"SELECT {columns} FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+        )
+    else:
+        cur = get_connection().execute(f"SELECT {columns} FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+    return [_as_dict(cur, row) for row in cur.fetchall()]
+
+
+def resolve_duplicate(job_id, action):
+    """Enregistre la décision sur un job en doublon ("reuse", "update" ou "process") et le remet en file."""
+    if action not in DUPLICATE_ACTIONS:
+        raise ValueError(f"Décision inconnue : {action}")
+    execute_write(
+        "UPDATE jobs SET status = 'pending', duplicate_action = ?, next_attempt_at = 0, "
+        "updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'duplicate'",
+        (action, job_id)
+    )
+
+
+def claim_job(worker_id):
+    """Réserve atomiquement le prochain job exécutable (nouveau, à retenter ou abandonné)."""
+    now = time.time()
+
+    def claim(conn):
+        cur = conn.execute("""
+            SELECT * FROM jobs
+            WHERE (status = 'pending' AND next_attempt_at <= ?)
+               OR (status = 'running' AND locked_at < ?)
+            ORDER BY id LIMIT 1
+        """, (now, now - JOB_LEASE_SECONDS))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        job = _as_dict(cur, row)
+        conn.execute(
+            "UPDATE jobs SET status = 'running', locked_by = ?, locked_at = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (worker_id, now, job["id"])
+        )
+        return job
+
+    # Le thread écrivain exécute l'opération dans une transaction IMMEDIATE : la réservation est atomique
+    return write(claim)
+
+
+def _backoff(attempts):
+    return min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def fail_job(job, worker_id, error, final=False, trace=None):
+    """Enregistre l'échec d'une tentative : le job est retenté plus tard, ou abandonné après JOB_MAX_ATTEMPTS."""
+    attempts = job["attempts"] + 1
+    final = final or attempts >= JOB_MAX_ATTEMPTS
+
+    def fail(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = ?, error = ?, next_attempt_at = ?, "
+            "locked_by = NULL, locked_at = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND locked_by = ?",
+            ("failed" if final else "pending", attempts, error, time.time() + _backoff(attempts), job["id"], worker_id)
+        )
+        if trace is not None:
+            trace.save(conn, job_id=job["id"])
+
+    write(fail)
+
+
+def run_job(job, worker_id):
+    """Exécute (ou reprend) un job et enregistre son résultat."""
+    job_id = job["id"]
+    last_flush = [0.0]
+
+    def save_checkpoint(column, value):
+        execute_write(
+            f"UPDATE jobs SET {column} = ?, partial_stage = NULL, partial_text = NULL, "
+            "locked_at = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND locked_by = ?",
+            (value, time.time(), job_id, worker_id)
+        )
+
+    def save_partial(stage, text, done):
+        now = time.monotonic()
+        if done or now - last_flush[0] < PARTIAL_FLUSH_INTERVAL:
+            return
+        last_flush[0] = now
+        # Simple indication de progression : inutile d'attendre le commit
+        execute_write(
+            "UPDATE jobs SET partial_stage = ?, partial_text = ?, locked_at = ? WHERE id = ? AND locked_by = ?",
+            (stage, text, time.time(), job_id, worker_id),
+            wait=False
+        )
+
+    def on_duplicate(duplicate):
+        if job["duplicate_action"]:
+            return job["duplicate_action"]
+        raise DuplicateLeadError(duplicate)
+
+    # Les mesures d'une tentative interrompue sont enregistrées avec le job seul, sans lead
+    trace = Trace()
+    try:
+        lead = process_card(
+            job["image"], job["qualification"], job["note"],
+            on_stage=save_partial,
+            checkpoint={column: job[column] for column in CHECKPOINT_COLUMNS},
+            on_checkpoint=save_checkpoint,
+            on_duplicate=on_duplicate,
+            trace=trace
+        )
+    except DuplicateLeadError as e:
+        # En attente de la décision de l'utilisateur : ce n'est pas un échec
+        duplicate = e.duplicate
+
+        def pause(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'duplicate', duplicate_of = ?, duplicate_reason = ?, partial_stage = NULL, "
+                "partial_text = NULL, locked_by = NULL, locked_at = NULL, updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND locked_by = ?",
+                (duplicate["id"], duplicate["reason"], job_id, worker_id)
+            )
+            trace.save(conn, job_id=job_id)
+
+        write(pause)
+        return
+    except Exception as e:
+        fail_job(job, worker_id, str(e), final=isinstance(e, NoTextError), trace=trace)
+        return
+
+    def complete(conn):
+        # Si le bail a été repris par un autre worker entre-temps, c'est lui qui insérera le lead
+        # Les points de reprise sont effacés : les textes ne sont conservés, compressés, qu'avec le lead (lead_id)
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'done', image = NULL, error = NULL, partial_stage = NULL, partial_text = NULL, "
+            "ocr_text = NULL, agent1 = NULL, agent2 = NULL, agent3 = NULL, locked_by = NULL, locked_at = NULL, "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = ? AND locked_by = ?",
+            (job_id, worker_id)
+        )
+        if cur.rowcount == 0:
+            return None
+        lead_id = save_lead(conn, lead, job_id)
+        conn.execute("UPDATE jobs SET lead_id = ? WHERE id = ?", (lead_id, job_id))
+        return lead_id
+
+    write(complete)
+
+
+def work(stop_event=None, worker_id=None):
+    """Boucle d'un worker : réserve et exécute les jobs jusqu'à stop_event."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            job = claim_job(worker_id)
+        except sqlite3.OperationalError:
+            job = None
+        if job is None:
+            stop_event.wait(JOB_POLL_INTERVAL)
+            continue
+        try:
+            run_job(job, worker_id)
+        except sqlite3.Error:
+            # Le job reste "running" et sera repris à l'expiration du bail
+            stop_event.wait(JOB_POLL_INTERVAL)
+        except Exception as e:
+            # Erreur imprévue hors du pipeline (enregistrement du lead...) : elle compte comme une tentative
+            # échouée, sans arrêter le worker (les workers intégrés ne sont jamais redémarrés)
+            try:
+                fail_job(job, worker_id, str(e))
+            except Exception:
+                pass
+            stop_event.wait(JOB_POLL_INTERVAL)
+
+
+def start_workers(count):
+    """Démarre `count` workers en threads daemon dans le processus courant."""
+    stop_event = threading.Event()
+    threads = []
+    for _ in range(count):
+        thread = threading.Thread(target=work, args=(stop_event,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    return stop_event, threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker de la file de traitement des cartes.")
+    parser.add_argument("--threads", type=int, default=2, help="Nombre de workers dans ce processus")
+    args = parser.parse_args(argv)
+
+    if API_KEYS_MISSING:
+        raise SystemExit("Veuillez définir les variables OPENAI_API_KEY, MISTRAL_API_KEY et TAVILY_API_KEY dans votre environnement.")
+
+    stop_event, threads = start_workers(args.threads)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Requêtes de lecture sur la table `leads` pour la page "Voir les leads".
+
+La liste est paginée par clé (keyset) sur (timestamp, id) grâce à un index
+dédié : chaque page coûte le même prix quelle que soit la taille de la
+table. Seules les colonnes courtes sont lues pour la liste : elles sont
+seules dans la table `leads`. Les textes longs (OCR, agents 1 à 3) sont
+stockés compressés dans `lead_texts` (voir text_store.py) et ne sont
+décompressés, via la vue `leads_full`, que pour le lead affiché en détail.
+
+La recherche plein texte s'appuie sur un index FTS5 (`leads_fts`) tenu à
+jour par des triggers sur `leads` et `lead_texts`.
+"""
+import re
+
+LIST_COLUMNS = ("id", "nom", "prenom", "telephone", "mail", "qualification", "timestamp")
+DETAIL_COLUMNS = ("id", "ocr_text", "nom", "prenom", "telephone", "mail",
+                  "agent1", "agent2", "agent3", "qualification", "note", "timestamp")
+
+
+def lead_filters(qualification=None, date_from=None, date_to=None, prefix="", clauses=None, params=None):
+    """Clauses WHERE des filtres qualification / plage de dates (bornes incluses)."""
+    clauses = [] if clauses is None else clauses
+    params = [] if params is None else params
+    if qualification:
+        clauses.append(f"{prefix}qualification = ?")
+        params.append(qualification)
+    if date_from:
+        clauses.append(f"{prefix}timestamp >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append(f"{prefix}timestamp < date(?, '+1 day')")
+        params.append(str(date_to))
+    return clauses, params
+
+
+def list_leads_page(cursor, page_size, after=None, qualification=None, date_from=None, date_to=None):
+    """
+    Retourne une page de leads (liste de dicts LIST_COLUMNS), du plus récent
+    au plus ancien. `after` est la clé (timestamp, id) du dernier lead de la
+    page précédente.
+    """
+    clauses, params = lead_filters(qualification, date_from, date_to)
+    if after is not None:
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    cursor.execute(
+        f"SELECT {', '.join(LIST_COLUMNS)} FROM leads {where}ORDER BY timestamp DESC, id DESC LIMIT ?",
+        (*params, page_size)
+    )
+    return [dict(zip(LIST_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def fts_query(text):
+    """Transforme la saisie utilisateur en requête FTS5 : chaque mot est cherché comme préfixe."""
+    words = re.findall(r"\w+", text, re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_leads(cursor, text, page_size, offset=0, qualification=None, date_from=None, date_to=None):
+    """
+    Recherche plein texte classée par pertinence (bm25). Retourne une page de
+    dicts LIST_COLUMNS + "extrait" (passage correspondant, termes en gras).
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    clauses, params = lead_filters(qualification, date_from, date_to, prefix="l.", clauses=["leads_fts MATCH ?"], params=[query])
+    columns = ", ".join(f"l.{c}" for c in LIST_COLUMNS)
+    cursor.execute(
+        f"SELECT {columns}, snippet(leads_fts, -1, '**', '**', '…', 12) "
+        "FROM leads_fts JOIN leads l ON l.id = leads_fts.rowid "
+        f"WHERE {' AND '.join(clauses)} ORDER BY bm25(leads_fts) LIMIT ? OFFSET ?",
+        (*params, page_size, offset)
+    )
+    return [dict(zip(LIST_COLUMNS + ("extrait",), row)) for row in cursor.fetchall()]
+
+
+def page_key(lead):
+    """Clé de pagination d'un lead de la liste."""
+    return (lead["timestamp"], lead["id"])
+
+
+def count_leads(cursor, text=None, qualification=None, date_from=None, date_to=None):
+    """Nombre de leads correspondant à la recherche et aux filtres (mêmes critères que la liste affichée)."""
+    query = fts_query(text) if text else ""
+    if query:
+        clauses, params = lead_filters(qualification, date_from, date_to, prefix="l.", clauses=["leads_fts MATCH ?"],
+                                   params=[query])
+        cursor.execute(
+            f"SELECT COUNT(*) FROM leads_fts JOIN leads l ON l.id = leads_fts.rowid WHERE {' AND '.join(clauses)}",
+            params
+        )
+    elif text:
+        # Saisie sans aucun mot cherchable : search_leads ne retourne rien
+        return 0
+    else:
+        clauses, params = lead_filters(qualification, date_from, date_to)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor.execute(f"SELECT COUNT(*) FROM leads{where}", params)
+    return cursor.fetchone()[0]
+
+
+def get_lead_details(cursor, lead_id):
+    """Charge toutes les colonnes d'un seul lead (textes OCR et agents compris)."""
+    cursor.execute(f"SELECT {', '.join(DETAIL_COLUMNS)} FROM leads_full WHERE id = ?", (lead_id,))
+    row = cursor.fetchone()
+    return dict(zip(DETAIL_COLUMNS, row)) if row else None
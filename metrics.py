@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation du pipeline : une trace par carte, un span par étape.
+
+Chaque span mesure le temps réel de l'étape et cumule ses compteurs (tours
+de stream, appels d'outils, tokens, tailles des requêtes et réponses, pages
+OCR, recherches Tavily), d'où l'on déduit un coût estimé. La trace courante
+et le span courant sont portés par des contextvars : les modules appelés
+(run_engine, chat_backend...) n'ont qu'à appeler record(), sans effet hors
+d'une trace. Les spans sont enregistrés dans `pipeline_metrics`, liés à
+l'id du lead, dans la transaction qui enregistre le lead.
+"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Prix en dollars, pour l'estimation du coût de chaque étape
+OPENAI_PRICE_INPUT_PER_M = float(os.getenv("OPENAI_PRICE_INPUT_PER_M", "2.5"))
+OPENAI_PRICE_OUTPUT_PER_M = float(os.getenv("OPENAI_PRICE_OUTPUT_PER_M", "10"))
+MISTRAL_OCR_PRICE_PER_PAGE = float(os.getenv("MISTRAL_OCR_PRICE_PER_PAGE", "0.001"))
+TAVILY_PRICE_PER_SEARCH = float(os.getenv("TAVILY_PRICE_PER_SEARCH", "0.016"))
+
+COUNTERS = ("rounds", "tool_calls", "prompt_tokens", "completion_tokens",
+            "request_bytes", "response_bytes", "ocr_pages", "searches")
+METRIC_COLUMNS = ("trace_id", "lead_id", "job_id", "stage", "started_at", "duration_ms") + COUNTERS + (
+    "cost_usd", "cache_hit", "error")
+INSERT_METRIC_SQL = (
+    f"INSERT INTO pipeline_metrics ({', '.join(METRIC_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in METRIC_COLUMNS)})"
+)
+
+_current_trace = ContextVar("pipeline_trace", default=None)
+_current_span = ContextVar("pipeline_span", default=None)
+
+
+class Span:
+    """Mesure d'une étape : durée, compteurs, succès en cache et erreur éventuelle."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.cache_hit = None
+        self.error = None
+
+    def add(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] += value or 0
+
+    @property
+    def cost_usd(self):
+        counts = self.counts
+        return (counts["prompt_tokens"] * OPENAI_PRICE_INPUT_PER_M / 1e6
+                + counts["completion_tokens"] * OPENAI_PRICE_OUTPUT_PER_M / 1e6
+                + counts["ocr_pages"] * MISTRAL_OCR_PRICE_PER_PAGE
+                + counts["searches"] * TAVILY_PRICE_PER_SEARCH)
+
+
+class Trace:
+    """Ensemble des spans du traitement d'une carte."""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+
+    @contextmanager
+    def activate(self):
+        """Rend la trace courante dans le contexte (thread) actuel."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def save(self, conn, lead_id=None, job_id=None):
+        """Enregistre les spans terminés dans la transaction de conn, puis les oublie."""
+        spans, self.spans = self.spans, []
+        conn.executemany(INSERT_METRIC_SQL, [
+            (self.trace_id, lead_id, job_id, s.stage, s.started_at, s.duration_ms)
+            + tuple(s.counts[name] for name in COUNTERS)
+            + (s.cost_usd, s.cache_hit, s.error)
+            for s in spans
+        ])
+
+
+@contextmanager
+def span(stage):
+    """Mesure le bloc comme une étape de la trace courante (simple chronomètre hors trace)."""
+    current = Span(stage)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration_ms = 1000 * (time.perf_counter() - start)
+        _current_span.reset(token)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(current)
+
+
+def record(**counts):
+    """Ajoute des compteurs au span courant ; sans effet hors d'un span."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(**counts)
+
+
+def load_metrics(cursor, since=None):
+    """Spans enregistrés depuis `since` (timestamp Unix), du plus ancien au plus récent."""
+    if since is None:
+        cursor.execute(f"SELECT {', '.join(METRIC_COLUMNS)} FROM pipeline_metrics ORDER BY started_at")
+    else:
+        cursor.execute(
+            f"SELECT {', '.join(METRIC_COLUMNS)} FROM pipeline_metrics WHERE started_at >= ? ORDER BY started_at",
+            (since,)
+        )
+    return [dict(zip(METRIC_COLUMNS, row)) for row in cursor.fetchall()]
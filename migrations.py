@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Migrations versionnées du schéma de leads.db.
+
+La version du schéma est stockée dans `PRAGMA user_version`. Au démarrage,
+migrate() lit cette version (une seule requête) et n'applique que les
+migrations manquantes, dans l'ordre, sous verrou : un verrou de thread dans
+le processus et une transaction EXCLUSIVE entre processus.
+
+Pour faire évoluer le schéma, ajouter une fonction à la fin de MIGRATIONS ;
+ne jamais modifier une migration déjà publiée.
+"""
+import threading
+
+from contact_extractor import mail_key, phone_key
+from text_store import TEXT_FIELDS, register_functions, train_dictionaries
+
+_lock = threading.Lock()
+
+LEADS_COLUMNS = (
+    ("ocr_text", "TEXT"), ("nom", "TEXT"), ("prenom", "TEXT"), ("telephone", "TEXT"), ("mail", "TEXT"),
+    ("agent1", "TEXT"), ("agent2", "TEXT"), ("agent3", "TEXT"), ("qualification", "TEXT"), ("note", "TEXT"),
+    ("timestamp", "DATETIME"),
+)
+FTS_COLUMNS = ("nom", "prenom", "mail", "ocr_text", "note", "agent1", "agent2", "agent3")
+
+
+def _001_leads(db):
+    """Table des leads ; les bases créées par d'anciennes versions reçoivent les colonnes manquantes."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ocr_text TEXT,
+            nom TEXT,
+            prenom TEXT,
+            telephone TEXT,
+            mail TEXT,
+            agent1 TEXT,
+            agent2 TEXT,
+            agent3 TEXT,
+            qualification TEXT,
+            note TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    existing = {row[1] for row in db.execute("PRAGMA table_info(leads)")}
+    for column, col_type in LEADS_COLUMNS:
+        if column not in existing:
+            db.execute(f"ALTER TABLE leads ADD COLUMN {column} {col_type}")
+
+
+def _002_leads_indexes(db):
+    """Index de la pagination (timestamp, id) et du filtre par qualification."""
+    db.execute("CREATE INDEX IF NOT EXISTS idx_leads_timestamp_id ON leads (timestamp, id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_leads_qualification_timestamp ON leads (qualification, timestamp)")
+
+
+def _003_leads_fts(db):
+    """Index plein texte FTS5 sur les leads, synchronisé par triggers."""
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    db.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5({columns}, content='leads', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leads_fts_insert AFTER INSERT ON leads BEGIN
+            INSERT INTO leads_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leads_fts_delete AFTER DELETE ON leads BEGIN
+            INSERT INTO leads_fts (leads_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leads_fts_update AFTER UPDATE ON leads BEGIN
+            INSERT INTO leads_fts (leads_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO leads_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    db.execute("INSERT INTO leads_fts (leads_fts) VALUES ('rebuild')")
+
+
+def _004_caches(db):
+    """Registre des assistants, cache OCR et cache de recherche Tavily."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS assistants (
+            name TEXT PRIMARY KEY,
+            definition_hash TEXT NOT NULL,
+            assistant_id TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            image_hash TEXT PRIMARY KEY,
+            pages TEXT NOT NULL,
+            ocr_text TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_access DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_access ON ocr_cache (last_access)")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache (
+            query_key TEXT PRIMARY KEY,
+            query TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_access ON search_cache (last_access)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_created_at ON search_cache (created_at)")
+
+
+def _005_jobs(db):
+    """File de traitements durable."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            image BLOB,
+            qualification TEXT,
+            note TEXT,
+            ocr_text TEXT,
+            agent1 TEXT,
+            agent2 TEXT,
+            agent3 TEXT,
+            partial_stage TEXT,
+            partial_text TEXT,
+            lead_id INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            locked_by TEXT,
+            locked_at REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_attempt_at)")
+
+
+def _006_duplicates(db):
+    """Clés de détection des doublons (mail et téléphone normalisés, empreinte d'image) et décision sur les jobs."""
+    for column in ("mail_key", "telephone_key", "image_phash"):
+        db.execute(f"ALTER TABLE leads ADD COLUMN {column} TEXT")
+    rows = db.execute("SELECT id, mail, telephone FROM leads").fetchall()
+    db.executemany(
+        "UPDATE leads SET mail_key = ?, telephone_key = ? WHERE id = ?",
+        [(mail_key(mail) or None, phone_key(telephone) or None, lead_id) for lead_id, mail, telephone in rows]
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_leads_mail_key ON leads (mail_key)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_leads_telephone_key ON leads (telephone_key)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_leads_image_phash ON leads (image_phash)")
+    db.execute("ALTER TABLE jobs ADD COLUMN duplicate_of INTEGER")
+    db.execute("ALTER TABLE jobs ADD COLUMN duplicate_reason TEXT")
+    db.execute("ALTER TABLE jobs ADD COLUMN duplicate_action TEXT")
+
+
+def _007_pipeline_metrics(db):
+    """Spans de mesure du pipeline (une ligne par étape de chaque carte)."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT NOT NULL,
+            lead_id INTEGER,
+            job_id INTEGER,
+            stage TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            duration_ms REAL NOT NULL,
+            rounds INTEGER NOT NULL DEFAULT 0,
+            tool_calls INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            request_bytes INTEGER NOT NULL DEFAULT 0,
+            response_bytes INTEGER NOT NULL DEFAULT 0,
+            ocr_pages INTEGER NOT NULL DEFAULT 0,
+            searches INTEGER NOT NULL DEFAULT 0,
+            cost_usd REAL NOT NULL DEFAULT 0,
+            cache_hit INTEGER,
+            error TEXT
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_started_at ON pipeline_metrics (started_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_lead_id ON pipeline_metrics (lead_id)")
+
+
+def _008_lead_texts(db):
+    """
+    Textes longs (OCR, agents) déplacés hors de `leads`, compressés dans
+    `lead_texts` ; la vue `leads_full` les recompose et sert de contenu à
+    l'index FTS, désormais synchronisé par des triggers sur les deux tables.
+    """
+    register_functions(db)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS text_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            field TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            samples INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS lead_texts (
+            lead_id INTEGER PRIMARY KEY,
+            ocr_text BLOB,
+            agent1 BLOB,
+            agent2 BLOB,
+            agent3 BLOB
+        )
+    """)
+    # Dictionnaires appris sur l'historique, puis copie compressée des textes existants
+    train_dictionaries(db, source="leads")
+    compressed = ", ".join(f"lead_text_compress('{c}', {c})" for c in TEXT_FIELDS)
+    db.execute(f"INSERT INTO lead_texts (lead_id, {', '.join(TEXT_FIELDS)}) SELECT id, {compressed} FROM leads")
+
+    for trigger in ("leads_fts_insert", "leads_fts_delete", "leads_fts_update"):
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    db.execute("DROP TABLE IF EXISTS leads_fts")
+    for column in TEXT_FIELDS:
+        db.execute(f"ALTER TABLE leads DROP COLUMN {column}")
+
+    lead_columns = [row[1] for row in db.execute("PRAGMA table_info(leads)")]
+    texts = ", ".join(f"lead_text(t.{c}) AS {c}" for c in TEXT_FIELDS)
+    db.execute(f"""
+        CREATE VIEW IF NOT EXISTS leads_full AS
+        SELECT {', '.join(f'l.{c}' for c in lead_columns)}, {texts}
+        FROM leads l LEFT JOIN lead_texts t ON t.lead_id = l.id
+    """)
+
+    columns = ", ".join(FTS_COLUMNS)
+    db.execute(
+        f"CREATE VIRTUAL TABLE leads_fts USING fts5({columns}, content='leads_full', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    # Le contenu indexé vient de la vue : on retire l'ancienne version avant chaque modification
+    # et on indexe la nouvelle après, que la modification porte sur leads ou sur lead_texts
+    remove = f"INSERT INTO leads_fts (leads_fts, rowid, {columns}) SELECT 'delete', id, {columns} FROM leads_full"
+    add = f"INSERT INTO leads_fts (rowid, {columns}) SELECT id, {columns} FROM leads_full"
+    indexed = ", ".join(c for c in FTS_COLUMNS if c not in TEXT_FIELDS)
+    triggers = (
+        ("leads_fts_insert", "AFTER INSERT ON leads", f"{add} WHERE id = new.id;"),
+        ("leads_fts_delete", "BEFORE DELETE ON leads", f"{remove} WHERE id = old.id;"),
+        ("leads_texts_delete", "AFTER DELETE ON leads", "DELETE FROM lead_texts WHERE lead_id = old.id;"),
+        ("leads_fts_before_update", f"BEFORE UPDATE OF {indexed} ON leads", f"{remove} WHERE id = old.id;"),
+        ("leads_fts_after_update", f"AFTER UPDATE OF {indexed} ON leads", f"{add} WHERE id = new.id;"),
+        ("lead_texts_fts_before_insert", "BEFORE INSERT ON lead_texts", f"{remove} WHERE id = new.lead_id;"),
+        ("lead_texts_fts_after_insert", "AFTER INSERT ON lead_texts", f"{add} WHERE id = new.lead_id;"),
+        ("lead_texts_fts_before_update", "BEFORE UPDATE ON lead_texts", f"{remove} WHERE id = old.lead_id;"),
+        ("lead_texts_fts_after_update", "AFTER UPDATE ON lead_texts", f"{add} WHERE id = new.lead_id;"),
+        ("lead_texts_fts_before_delete", "BEFORE DELETE ON lead_texts", f"{remove} WHERE id = old.lead_id;"),
+        ("lead_texts_fts_after_delete", "AFTER DELETE ON lead_texts", f"{add} WHERE id = old.lead_id;"),
+    )
+    for name, event, body in triggers:
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+    db.execute("INSERT INTO leads_fts (leads_fts) VALUES ('rebuild')")
+
+
+def _009_done_jobs_texts(db):
+    """Textes des jobs terminés effacés : ils sont stockés, compressés, avec le lead."""
+    db.execute(
+        "UPDATE jobs SET ocr_text = NULL, agent1 = NULL, agent2 = NULL, agent3 = NULL "
+        "WHERE status = 'done' AND lead_id IS NOT NULL"
+    )
+
+
+def _010_search_cache_stats(db):
+    """Compteurs journaliers du cache de recherche, partagés par tous les processus."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache_stats (
+            day TEXT NOT NULL,
+            counter TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, counter)
+        )
+    """)
+
+
+def _011_assistant_versions(db):
+    """Une ligne par version (nom, définition) des assistants, avec sa date de dernière utilisation."""
+    db.execute("""
+        CREATE TABLE assistants_versions (
+            name TEXT NOT NULL,
+            definition_hash TEXT NOT NULL,
+            assistant_id TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_used_at REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, definition_hash)
+        )
+    """)
+    db.execute("""
+        INSERT INTO assistants_versions (name, definition_hash, assistant_id, created_at, last_used_at)
+        SELECT name, definition_hash, assistant_id, created_at, CAST(strftime('%s', 'now') AS REAL) FROM assistants
+    """)
+    db.execute("DROP TABLE assistants")
+    db.execute("ALTER TABLE assistants_versions RENAME TO assistants")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_assistants_assistant_id ON assistants (assistant_id)")
+
+
+MIGRATIONS = [_001_leads, _002_leads_indexes, _003_leads_fts, _004_caches, _005_jobs, _006_duplicates,
+              _007_pipeline_metrics, _008_lead_texts, _009_done_jobs_texts, _010_search_cache_stats,
+              _011_assistant_versions]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """Amène le schéma de la base à SCHEMA_VERSION. Sans effet (une lecture de pragma) s'il est à jour."""
+    if schema_version(db) >= SCHEMA_VERSION:
+        return
+    with _lock:
+        db.execute("BEGIN EXCLUSIVE")
+        try:
+            # Un autre processus a pu migrer pendant l'attente du verrou
+            version = schema_version(db)
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                migration(db)
+                db.execute(f"PRAGMA user_version = {number}")
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des résultats OCR, adressé par le contenu de l'image.
+
+La clé est le SHA-256 des octets de l'image : une même carte (toujours
+présente dans camera_input / file_uploader après une modification de la
+note ou un échec d'assistant) ne repasse pas par Mistral OCR. Le cache est
+stocké dans leads.db et borné en taille avec une éviction LRU.
+"""
+import hashlib
+import json
+import os
+
+from db import execute_write, get_connection, write
+
+# Taille maximale du cache (en octets de pages + texte) avant éviction
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def image_hash(image_bytes):
+    """Empreinte SHA-256 des octets de l'image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _serialize_pages(ocr_response):
+    """Convertit les pages brutes de la réponse OCR en JSON."""
+    pages = ocr_response.pages if hasattr(ocr_response, "pages") else (ocr_response if isinstance(ocr_response, list) else [])
+    serialized = []
+    for page in pages:
+        if hasattr(page, "model_dump"):
+            serialized.append(page.model_dump())
+        else:
+            serialized.append({"markdown": getattr(page, "markdown", "")})
+    return json.dumps(serialized, ensure_ascii=False, default=str)
+
+
+def get_cached_ocr(image_bytes):
+    """
+    Retourne {"pages": [...], "ocr_text": "..."} si l'image est en cache,
+    sinon None. Un accès met à jour la date d'utilisation (LRU).
+    """
+    key = image_hash(image_bytes)
+    row = get_connection().execute("SELECT pages, ocr_text FROM ocr_cache WHERE image_hash = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    # Mise à jour LRU en arrière-plan : la lecture n'attend pas le thread écrivain
+    execute_write(
+        "UPDATE ocr_cache SET last_access = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE image_hash = ?",
+        (key,), wait=False
+    )
+    return {"pages": json.loads(row[0]), "ocr_text": row[1]}
+
+
+def store_ocr_result(image_bytes, ocr_response, ocr_text):
+    """Enregistre les pages OCR brutes et le texte extrait, puis applique l'éviction LRU."""
+    key = image_hash(image_bytes)
+    pages = _serialize_pages(ocr_response)
+    size = len(pages.encode("utf-8")) + len(ocr_text.encode("utf-8"))
+
+    def store(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (image_hash, pages, ocr_text, size) VALUES (?, ?, ?, ?)",
+            (key, pages, ocr_text, size)
+        )
+        _evict(conn)
+
+    write(store)
+
+
+def _evict(conn):
+    """Supprime les entrées les moins récemment utilisées au-delà de OCR_CACHE_MAX_BYTES."""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+    if total <= OCR_CACHE_MAX_BYTES:
+        return
+    rows = conn.execute("SELECT image_hash, size FROM ocr_cache ORDER BY last_access ASC, created_at ASC").fetchall()
+    for key, size in rows:
+        if total <= OCR_CACHE_MAX_BYTES:
+            break
+        conn.execute("DELETE FROM ocr_cache WHERE image_hash = ?", (key,))
+        total -= size
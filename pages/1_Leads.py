@@ -1,107 +1,117 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
+from db import execute_write, get_connection, write
+from leads_store import list_leads_page, search_leads, page_key, count_leads, get_lead_details
+from text_store import store_texts
 
 st.set_page_config(page_title="Le charte visite 🐱 - Voir les leads", layout="centered")
 st.title("Le charte visite 🐱 - Voir les leads")
 
-# Connexion à la base de données
-conn = sqlite3.connect("leads.db", check_same_thread=False)
+# Connexion de lecture du thread courant (WAL, schéma migré au premier accès)
+conn = get_connection()
 cursor = conn.cursor()
 
-# Fonction pour vérifier si une table existe
-def table_exists(cursor, table_name):
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    return cursor.fetchone() is not None
-
-# Fonction pour créer la table si elle n'existe pas
-def create_leads_table(cursor):
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS leads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ocr_text TEXT,
-            nom TEXT,
-            prenom TEXT,
-            telephone TEXT,
-            mail TEXT,
-            agent1 TEXT,
-            agent2 TEXT,
-            agent3 TEXT,
-            qualification TEXT,
-            note TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-# Fonction pour ajouter une colonne si elle est absente
-def add_column_if_missing(cursor, table, column, col_type):
-    cursor.execute(f"PRAGMA table_info({table})")
-    columns = [row[1] for row in cursor.fetchall()]
-    if column not in columns:
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
-        conn.commit()
-
-# Création de la table si elle n'existe pas
-create_leads_table(cursor)
-
-# Migration du schéma : ajout des colonnes manquantes
-add_column_if_missing(cursor, "leads", "ocr_text", "TEXT")
-add_column_if_missing(cursor, "leads", "nom", "TEXT")
-add_column_if_missing(cursor, "leads", "prenom", "TEXT")
-add_column_if_missing(cursor, "leads", "telephone", "TEXT")
-add_column_if_missing(cursor, "leads", "mail", "TEXT")
-add_column_if_missing(cursor, "leads", "agent1", "TEXT")
-add_column_if_missing(cursor, "leads", "agent2", "TEXT")
-add_column_if_missing(cursor, "leads", "agent3", "TEXT")
-add_column_if_missing(cursor, "leads", "qualification", "TEXT")
-add_column_if_missing(cursor, "leads", "note", "TEXT")
-add_column_if_missing(cursor, "leads", "timestamp", "DATETIME DEFAULT CURRENT_TIMESTAMP")
-
 # Bouton pour ajouter une ligne fictive
 if st.button("Ajouter une ligne fictive"):
-    dummy_data = (
-        "Ceci est un OCR fictif",
-        "Doe",
-        "John",
-        "0123456789",
-        "john.doe@example.com",
-        "Réponse fictive agent1",
-        "Réponse fictive agent2",
-        "Réponse fictive agent3",
-        "Smart Talk",
-        "Ceci est une note fictive"
-    )
-    cursor.execute(
-        "INSERT INTO leads (ocr_text, nom, prenom, telephone, mail, agent1, agent2, agent3, qualification, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        dummy_data
-    )
-    conn.commit()
+    def insert_dummy(conn):
+        lead_id = conn.execute(
+            "INSERT INTO leads (nom, prenom, telephone, mail, qualification, note) VALUES (?, ?, ?, ?, ?, ?)",
+            ("Doe", "John", "0123456789", "john.doe@example.com", "Smart Talk", "Ceci est une note fictive")
+        ).lastrowid
+        store_texts(conn, lead_id, {
+            "ocr_text": "Ceci est un OCR fictif",
+            "agent1": "Réponse fictive agent1",
+            "agent2": "Réponse fictive agent2",
+            "agent3": "Réponse fictive agent3",
+        })
+
+    write(insert_dummy)
     st.success("Ligne fictive ajoutée.")
 
 # Bouton pour reset la base de données (supprime toutes les lignes)
 if st.button("Reset la base de données"):
-    cursor.execute("DELETE FROM leads")
-    conn.commit()
+    execute_write("DELETE FROM leads")
+    st.session_state["leads_page_keys"] = []
+    st.session_state["leads_search_offset"] = 0
     st.success("La base de données a été réinitialisée.")
 
-# Récupération et affichage des données
+# Recherche plein texte et filtres
+search_text = st.text_input("Rechercher", placeholder="Nom, mail, entreprise, mot de la note...")
+col_qualif, col_from, col_to = st.columns(3)
+qualification = col_qualif.selectbox("Qualification", ["Toutes", "Smart Talk", "Mise en avant de la formation",
+                                                       "Mise en avant des audits", "Mise en avant des modules IA"])
+qualification = None if qualification == "Toutes" else qualification
+date_from = col_from.date_input("Du", value=None)
+date_to = col_to.date_input("Au", value=None)
+
+# Récupération et affichage des données : une page à la fois, colonnes courtes uniquement
+page_size = st.selectbox("Leads par page", [25, 50, 100], index=1)
+
+# Tout changement de recherche ou de filtre repart de la première page
+criteria = (search_text.strip(), qualification, date_from, date_to, page_size)
+if st.session_state.get("leads_criteria") != criteria:
+    st.session_state["leads_criteria"] = criteria
+    st.session_state["leads_page_keys"] = []
+    st.session_state["leads_search_offset"] = 0
+# Pile des clés (timestamp, id) des fins de pages précédentes (liste), ou décalage (recherche classée)
+page_keys = st.session_state.setdefault("leads_page_keys", [])
+search_offset = st.session_state.setdefault("leads_search_offset", 0)
+filters = {"qualification": qualification, "date_from": date_from, "date_to": date_to}
 try:
-    cursor.execute("""
-        SELECT id, ocr_text, nom, prenom, telephone, mail, 
-               agent1, agent2, agent3, qualification, note, timestamp 
-        FROM leads ORDER BY timestamp DESC
-    """)
-    rows = cursor.fetchall()
-    
-    if rows:
-        columns = [description[0] for description in cursor.description]
-        df = pd.DataFrame(rows, columns=columns)
-        st.dataframe(df)
+    if search_text.strip():
+        rows = search_leads(cursor, search_text, page_size, offset=search_offset, **filters)
+        page_number = search_offset // page_size + 1
     else:
-        st.info("Aucun lead n'a été enregistré pour le moment.")
+        rows = list_leads_page(cursor, page_size, after=page_keys[-1] if page_keys else None, **filters)
+        page_number = len(page_keys) + 1
+    total = count_leads(cursor, search_text.strip(), **filters)
 except Exception as e:
+    rows, total = None, 0
     st.error("Erreur lors de la récupération des leads : " + str(e))
 
-# Fermeture de la connexion à la base de données
-conn.close()
+if rows:
+    active = search_text.strip() or any(filters.values())
+    st.caption(f"Page {page_number} - {total} leads {'correspondants' if active else 'au total'}")
+    df = pd.DataFrame(rows)
+    selection = st.dataframe(df, hide_index=True, on_select="rerun", selection_mode="single-row")
+
+    col_prev, col_next = st.columns(2)
+    if col_prev.button("Page précédente", disabled=page_number == 1):
+        if search_text.strip():
+            st.session_state["leads_search_offset"] = max(0, search_offset - page_size)
+        else:
+            page_keys.pop()
+        st.rerun()
+    if col_next.button("Page suivante", disabled=len(rows) < page_size):
+        if search_text.strip():
+            st.session_state["leads_search_offset"] = search_offset + page_size
+        else:
+            page_keys.append(page_key(rows[-1]))
+        st.rerun()
+
+    # Détail du lead sélectionné : les textes longs ne sont chargés qu'ici
+    selected_rows = selection.selection.rows
+    if selected_rows:
+        lead = get_lead_details(cursor, rows[selected_rows[0]]["id"])
+        if lead:
+            st.subheader(f"{lead['prenom']} {lead['nom']}")
+            st.write(f"**Téléphone :** {lead['telephone']}  \n**Mail :** {lead['mail']}  \n"
+                     f"**Qualification :** {lead['qualification']}  \n**Date :** {lead['timestamp']}")
+            st.write(f"**Note :** {lead['note']}")
+            with st.expander("Texte OCR"):
+                st.text(lead["ocr_text"])
+            with st.expander("Réponse agent 1"):
+                st.markdown(lead["agent1"] or "")
+            with st.expander("Réponse agent 2"):
+                st.markdown(lead["agent2"] or "")
+            with st.expander("Réponse agent 3"):
+                st.markdown(lead["agent3"] or "")
+elif rows is not None and page_number > 1:
+    # Page devenue vide (leads supprimés) : on revient à la première
+    st.session_state["leads_page_keys"] = []
+    st.session_state["leads_search_offset"] = 0
+    st.rerun()
+elif rows is not None and any(criteria[:4]):
+    st.info("Aucun lead ne correspond à la recherche.")
+elif rows is not None:
+    st.info("Aucun lead n'a été enregistré pour le moment.")
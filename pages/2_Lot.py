@@ -0,0 +1,58 @@
+import streamlit as st
+import pandas as pd
+from pipeline import API_KEYS_MISSING
+from batch import images_from_zip, run_batch
+
+st.set_page_config(page_title="Le charte visite 🐱 - Traitement par lot", layout="centered")
+st.title("Le charte visite 🐱 - Traitement par lot")
+
+if API_KEYS_MISSING:
+    st.error("Veuillez définir les variables OPENAI_API_KEY, MISTRAL_API_KEY et TAVILY_API_KEY dans votre environnement.")
+    st.stop()
+
+# Sélection des cartes : plusieurs images et/ou archives zip
+uploaded_files = st.file_uploader(
+    "Uploader les cartes (images ou archive zip)",
+    type=["jpg", "jpeg", "png", "zip"],
+    accept_multiple_files=True
+)
+
+qualification = st.selectbox("Qualification des leads",
+                             ["Smart Talk", "Mise en avant de la formation", "Mise en avant des audits", "Mise en avant des modules IA"])
+note = st.text_area("Note commune au lot", placeholder="Ex : rencontré sur le salon ...")
+DUPLICATE_CHOICES = {
+    "Traiter quand même": "process",
+    "Réutiliser le lead existant": "reuse",
+    "Mettre à jour le lead existant (sans relancer les assistants)": "update",
+}
+duplicates = st.radio("Cartes déjà enregistrées", list(DUPLICATE_CHOICES), horizontal=True)
+
+cards = []
+for uploaded in uploaded_files or []:
+    if uploaded.name.lower().endswith(".zip"):
+        cards.extend(images_from_zip(uploaded.getvalue()))
+    else:
+        cards.append((uploaded.name, uploaded.getvalue()))
+
+if cards:
+    st.info(f"{len(cards)} carte(s) prête(s) à être traitée(s).")
+
+if st.button("Lancer le traitement"):
+    if not cards:
+        st.error("Aucune carte n'a été fournie.")
+    elif note.strip() == "":
+        st.error("Veuillez saisir une note avant de continuer.")
+    else:
+        progress = st.progress(0.0)
+        status = st.empty()
+
+        # Progression en direct : appelée depuis le thread du script après chaque carte
+        def report(done, total, result):
+            progress.progress(done / total)
+            status.text(f"{done}/{total} - {result['fichier']} : {result['statut']}")
+
+        results = run_batch(cards, qualification, note, on_progress=report,
+                            duplicates=DUPLICATE_CHOICES[duplicates])
+        ok = sum(1 for r in results if r["statut"] == "ok")
+        st.success(f"{ok}/{len(results)} cartes traitées et enregistrées.")
+        st.dataframe(pd.DataFrame(results))
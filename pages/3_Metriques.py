@@ -0,0 +1,85 @@
+import time
+import streamlit as st
+import pandas as pd
+from db import get_connection
+from metrics import load_metrics
+
+st.set_page_config(page_title="Le charte visite 🐱 - Métriques", layout="wide")
+st.title("Le charte visite 🐱 - Métriques du pipeline")
+
+PERIODS = {"24 heures": 1, "7 jours": 7, "30 jours": 30, "Tout": None}
+BUCKETS = {"Heure": "h", "Jour": "D", "Semaine": "W"}
+
+col_period, col_bucket = st.columns(2)
+period = col_period.selectbox("Période", list(PERIODS), index=1)
+bucket = col_bucket.selectbox("Regroupement", list(BUCKETS), index=1)
+
+days = PERIODS[period]
+rows = load_metrics(get_connection().cursor(), since=time.time() - days * 86400 if days else None)
+if not rows:
+    st.info("Aucune mesure enregistrée sur cette période.")
+    st.stop()
+
+df = pd.DataFrame(rows)
+df["date"] = pd.to_datetime(df["started_at"], unit="s")
+df["tokens"] = df["prompt_tokens"] + df["completion_tokens"]
+
+# Vue d'ensemble par carte : coût et durée totale des traces ayant abouti à un lead
+traces = df[df["lead_id"].notna()].groupby("trace_id").agg(cost_usd=("cost_usd", "sum"))
+col_cards, col_cost, col_errors = st.columns(3)
+col_cards.metric("Cartes mesurées", len(traces))
+col_cost.metric("Coût moyen par carte", f"{traces['cost_usd'].mean():.4f} $" if len(traces) else "-")
+col_errors.metric("Étapes en erreur", int(df["error"].notna().sum()))
+
+# Percentiles de durée par étape
+st.subheader("Durée par étape (ms)")
+summary = df.groupby("stage").agg(
+    appels=("duration_ms", "size"),
+    p50=("duration_ms", lambda s: s.quantile(0.50)),
+    p95=("duration_ms", lambda s: s.quantile(0.95)),
+    p99=("duration_ms", lambda s: s.quantile(0.99)),
+    tours=("rounds", "mean"),
+    appels_outils=("tool_calls", "mean"),
+    tokens_prompt=("prompt_tokens", "mean"),
+    tokens_completion=("completion_tokens", "mean"),
+    octets_envoyes=("request_bytes", "mean"),
+    octets_recus=("response_bytes", "mean"),
+    taux_cache=("cache_hit", "mean"),
+    cout_total=("cost_usd", "sum"),
+).sort_values("p95", ascending=False)
+st.dataframe(summary.round(2), use_container_width=True)
+
+# Évolution des percentiles dans le temps, pour repérer les régressions
+st.subheader("Évolution dans le temps")
+col_stage, col_percentile = st.columns(2)
+stages = sorted(df["stage"].unique())
+selected = col_stage.multiselect("Étapes", stages, default=[s for s in stages if s.startswith(("ocr", "agent"))] or stages)
+percentile = col_percentile.radio("Percentile", ["p50", "p95", "p99"], index=1, horizontal=True)
+quantile = int(percentile[1:]) / 100
+
+if selected:
+    timeline = (
+        df[df["stage"].isin(selected)]
+        .groupby([pd.Grouper(key="date", freq=BUCKETS[bucket]), "stage"])["duration_ms"]
+        .quantile(quantile)
+        .unstack("stage")
+    )
+    st.line_chart(timeline)
+
+    tokens = (
+        df[df["stage"].isin(selected)]
+        .groupby([pd.Grouper(key="date", freq=BUCKETS[bucket]), "stage"])["tokens"]
+        .mean()
+        .unstack("stage")
+    )
+    st.caption("Tokens moyens par appel")
+    st.line_chart(tokens)
+
+# Détail d'un lead
+lead_id = st.number_input("Détail des étapes d'un lead (id)", min_value=0, step=1, value=0)
+if lead_id:
+    detail = df[df["lead_id"] == lead_id].drop(columns=["date", "tokens"])
+    if detail.empty:
+        st.info("Aucune mesure pour ce lead sur cette période.")
+    else:
+        st.dataframe(detail, use_container_width=True)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import streamlit as st
+from export import COMPRESSIONS, EXPORT_COLUMNS, available_formats, default_filename, export_leads
+
+st.set_page_config(page_title="Le charte visite 🐱 - Export", layout="centered")
+st.title("Le charte visite 🐱 - Export des leads")
+
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+formats = available_formats()
+col_format, col_compression = st.columns(2)
+fmt = col_format.selectbox("Format", formats, format_func=str.upper)
+compression = col_compression.selectbox("Compression", COMPRESSIONS[fmt])
+if "parquet" not in formats:
+    st.caption("Parquet indisponible : installez le paquet pyarrow pour l'activer.")
+
+columns = st.multiselect("Colonnes", EXPORT_COLUMNS, default=[c for c in EXPORT_COLUMNS if c != "ocr_text"])
+col_from, col_to = st.columns(2)
+date_from = col_from.date_input("Du", value=None)
+date_to = col_to.date_input("Au", value=None)
+
+
+def discard_export():
+    """Supprime le fichier préparé (après téléchargement ou avant un nouvel export)."""
+    prepared = st.session_state.pop("export_file", None)
+    if prepared and os.path.exists(prepared[0]):
+        os.remove(prepared[0])
+
+
+if st.button("Préparer l'export"):
+    if not columns:
+        st.error("Veuillez choisir au moins une colonne.")
+    else:
+        discard_export()
+        # Export en flux vers un fichier temporaire compressé : la session ne garde que son chemin,
+        # le contenu n'est jamais chargé en mémoire par la page
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as output:
+            path = output.name
+        try:
+            with st.spinner("Export en cours..."):
+                count = export_leads(path, fmt, columns, date_from, date_to, compression)
+        except Exception:
+            os.remove(path)
+            raise
+        mime = MIME_TYPES[fmt] if fmt == "parquet" or compression == "none" else "application/octet-stream"
+        st.session_state["export_file"] = (path, default_filename(fmt, compression), mime, count)
+
+if "export_file" in st.session_state:
+    path, filename, mime, count = st.session_state["export_file"]
+    if not os.path.exists(path):
+        st.session_state.pop("export_file")
+    else:
+        st.success(f"{count} leads exportés ({os.path.getsize(path) / 1024:.0f} Ko).")
+        with open(path, "rb") as f:
+            st.download_button("Télécharger", data=f, file_name=filename, mime=mime, on_click=discard_export)
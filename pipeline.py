@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de traitement d'une carte de visite, indépendant de Streamlit :
+OCR Mistral -> assistant 1 (extraction & recherche) -> assistant 2 (matching
+produits) -> assistant 3 (mail de relance) -> insertion dans `leads`.
+
+Utilisé par la page principale (une carte à la fois) et par le traitement
+par lot.
+"""
+import os
+import base64
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+from openai import NotFoundError, OpenAI
+from mistralai import Mistral
+from tavily import TavilyClient
+from assistant_registry import ensure_assistant, forget_assistant
+from run_engine import stream_run
+from chat_backend import stream_chat
+from ocr_cache import get_cached_ocr, store_ocr_result
+from search_cache import cached_search
+from rate_limit import limiters
+from image_prep import perceptual_hash, preprocess_image
+from db import get_connection, write
+from contact_extractor import (best_fields, extract_contacts, format_contacts, is_confident, mail_key, merge_fields,
+                               phone_key, residual_text)
+from duplicates import find_duplicate
+from leads_store import get_lead_details
+from metrics import Trace, record, span
+from text_store import TEXT_FIELDS, store_texts
+
+##############################
+# Clés API & initialisation  #
+##############################
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+# Backend d'exécution des agents : "assistants" (API Assistants) ou "chat" (chat completions)
+PIPELINE_BACKEND = os.getenv("PIPELINE_BACKEND", "assistants")
+# Nombre maximal d'appels d'outils exécutés en parallèle pour une même étape
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+
+API_KEYS_MISSING = not OPENAI_API_KEY or not MISTRAL_API_KEY or not TAVILY_API_KEY
+
+client_openai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+client_mistral = Mistral(api_key=MISTRAL_API_KEY) if MISTRAL_API_KEY else None
+tavily_client = TavilyClient(api_key=TAVILY_API_KEY) if TAVILY_API_KEY else None
+
+# Colonnes de la ligne `leads` ; les textes longs (TEXT_FIELDS) sont stockés compressés à part
+LEAD_COLUMNS = ("nom", "prenom", "telephone", "mail", "qualification", "note", "mail_key", "telephone_key", "image_phash")
+INSERT_LEAD_SQL = (
+    f"INSERT INTO leads ({', '.join(LEAD_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in LEAD_COLUMNS)})"
+)
+# Mise à jour d'un lead existant par un doublon : les champs vides de la nouvelle carte ne l'écrasent pas
+UPDATE_DUPLICATE_SQL = """
+    UPDATE leads SET
+        nom = COALESCE(NULLIF(?, ''), nom),
+        prenom = COALESCE(NULLIF(?, ''), prenom),
+        telephone = COALESCE(NULLIF(?, ''), telephone),
+        mail = COALESCE(NULLIF(?, ''), mail),
+        qualification = ?,
+        note = ?,
+        mail_key = COALESCE(?, mail_key),
+        telephone_key = COALESCE(?, telephone_key),
+        image_phash = COALESCE(?, image_phash)
+    WHERE id = ?
+"""
+
+
+def lead_values(lead):
+    """Valeurs d'un lead dans l'ordre de LEAD_COLUMNS."""
+    return tuple(lead[column] for column in LEAD_COLUMNS)
+
+
+class NoTextError(Exception):
+    """L'OCR n'a extrait aucun texte exploitable de l'image."""
+
+
+##############################
+# Fonctions utilitaires      #
+##############################
+def clean_response(response):
+    """Nettoie la rÃ©ponse en supprimant les tags HTML et convertit '\\n' en retours Ã  la ligne."""
+    match = re.search(r'value="(.*?)"\)', response, re.DOTALL)
+    cleaned = match.group(1) if match else response
+    cleaned = re.sub(r'<[^>]+>', '', cleaned)
+    return cleaned.replace("\\n", "\n").strip()
+
+def extract_text_from_ocr_response(ocr_response):
+    """Extrait le texte OCR en ignorant les balises image."""
+    extracted_text = ""
+    pages = ocr_response.pages if hasattr(ocr_response, "pages") else (ocr_response if isinstance(ocr_response, list) else [])
+    for page in pages:
+        if hasattr(page, "markdown") and page.markdown:
+            lines = page.markdown.split("\n")
+            filtered = [line.strip() for line in lines if not line.startswith("![")]
+            if filtered:
+                extracted_text += "\n".join(filtered) + "\n"
+    return extracted_text.strip()
+
+def image_to_data_uri(image_bytes, mime="image/jpeg"):
+    """Encode l'image en data URI base64 pour l'API OCR."""
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+    return f"data:{mime};base64,{base64_image}"
+
+def run_ocr(image_bytes):
+    """
+    Extrait le texte de la carte via Mistral OCR, en réutilisant le cache si
+    l'image est connue. L'image est réduite et réencodée avant l'envoi.
+    """
+    with span("ocr") as current:
+        cached = get_cached_ocr(image_bytes)
+        current.cache_hit = cached is not None
+        if cached is not None:
+            current.add(response_bytes=len(cached["ocr_text"].encode("utf-8")))
+            return cached["ocr_text"]
+        with span("image_prep"):
+            prepared_bytes, mime = preprocess_image(image_bytes)
+        with limiters["mistral"]:
+            ocr_response = client_mistral.ocr.process(
+                model="mistral-ocr-latest",
+                document={"type": "image_url", "image_url": image_to_data_uri(prepared_bytes, mime)}
+            )
+        ocr_text = extract_text_from_ocr_response(ocr_response)
+        current.add(request_bytes=len(prepared_bytes), response_bytes=len(ocr_text.encode("utf-8")),
+                    ocr_pages=len(getattr(ocr_response, "pages", None) or []))
+        store_ocr_result(image_bytes, ocr_response, ocr_text)
+        return ocr_text
+
+def _tavily_get_search_context(query):
+    record(searches=1)
+    with limiters["tavily"]:
+        return tavily_client.get_search_context(query, search_depth="advanced", max_tokens=8000)
+
+def tavily_search(query):
+    """Effectue une recherche en ligne via Tavily (résultat mis en cache et requêtes simultanées mutualisées)."""
+    with span("tavily_search") as current:
+        result = cached_search(query, _tavily_get_search_context)
+        # Pas de recherche lancée par ce thread : résultat en cache ou mutualisé
+        current.cache_hit = current.counts["searches"] == 0
+        current.add(request_bytes=len(query.encode("utf-8")), response_bytes=len(result.encode("utf-8")))
+        return result
+
+def call_tool(tool):
+    """Exécute un appel d'outil ; une erreur est renvoyée comme sortie pour ne pas perdre les autres appels."""
+    try:
+        if tool.function.name == "tavily_search":
+            query = json.loads(tool.function.arguments)["query"]
+            return tavily_search(query)
+        return f"Outil inconnu : {tool.function.name}"
+    except Exception as e:
+        return f"Erreur lors de l'appel à {tool.function.name} : {e}"
+
+def build_tool_outputs(tools_to_call):
+    """Exécute en parallèle les appels d'outils demandés par l'assistant et retourne leurs sorties dans l'ordre."""
+    tools_to_call = list(tools_to_call)
+    record(tool_calls=len(tools_to_call))
+    if len(tools_to_call) <= 1:
+        outputs = [call_tool(tool) for tool in tools_to_call]
+    else:
+        with ThreadPoolExecutor(max_workers=min(TOOL_MAX_WORKERS, len(tools_to_call))) as executor:
+            # Chaque appel s'exécute dans une copie du contexte : ses spans rejoignent la trace de la carte
+            futures = [executor.submit(copy_context().run, call_tool, tool) for tool in tools_to_call]
+            outputs = [future.result() for future in futures]
+    return [{"tool_call_id": tool.id, "output": output} for tool, output in zip(tools_to_call, outputs)]
+
+def _run_assistant(agent, user_message, on_text=None, retry=True):
+    """Exécute un agent avec l'API Assistants ; recrée l'assistant s'il a disparu côté OpenAI."""
+    assistant_id = ensure_assistant(
+        client_openai, agent["name"], agent["instructions"], agent["model"], tools=agent["tools"]
+    )
+    try:
+        return stream_run(
+            client_openai, assistant_id, user_message,
+            tool_handler=build_tool_outputs, on_text=on_text
+        )
+    except NotFoundError:
+        if not retry:
+            raise
+        forget_assistant(agent["name"], assistant_id)
+        return _run_assistant(agent, user_message, on_text, retry=False)
+
+def run_agent(agent, user_message, on_text=None):
+    """Exécute un agent via le backend configuré et retourne sa réponse nettoyée."""
+    record(request_bytes=len(user_message.encode("utf-8")))
+    with limiters["openai"]:
+        if PIPELINE_BACKEND == "chat":
+            response = stream_chat(
+                client_openai, agent["instructions"], user_message, agent["model"],
+                tools=agent["tools"], tool_handler=build_tool_outputs, on_text=on_text
+            )
+        else:
+            response = _run_assistant(agent, user_message, on_text)
+    record(response_bytes=len(response.encode("utf-8")))
+    return clean_response(response)
+
+def parse_agent1_response(text):
+    """
+    Extrait Nom, PrÃ©nom, TÃ©lÃ©phone et Mail Ã  partir de la rÃ©ponse de l'assistant 1.
+    La rÃ©ponse doit contenir des lignes telles que :
+      Nom: Doe
+      PrÃ©nom: John
+      TÃ©lÃ©phone: 0123456789
+      Mail: john.doe@example.com
+    """
+    data = {"nom": "", "prenom": "", "telephone": "", "mail": ""}
+    nom = re.search(r"Nom\s*:\s*(.+)", text)
+    prenom = re.search(r"Pr[Ã©e]nom\s*:\s*(.+)", text)
+    tel = re.search(r"T[eÃ©]l[eÃ©]phone?\s*:\s*(.+)", text, re.IGNORECASE)
+    mail = re.search(r"Mail\s*:\s*(.+)", text, re.IGNORECASE)
+    if nom:
+        data["nom"] = nom.group(1).strip()
+    if prenom:
+        data["prenom"] = prenom.group(1).strip()
+    if tel:
+        data["telephone"] = tel.group(1).strip()
+    if mail:
+        data["mail"] = mail.group(1).strip()
+    return data
+
+##############################
+# DÃ©finition des assistants  #
+##############################
+# Assistant 1 : Extraction & recherche
+assistant_prompt_instruction = """
+Vous Ãªtes Chat IA, expert en analyse de cartes de visite.
+Votre tÃ¢che est d'extraire les informations suivantes du texte OCR fourni :
+    - Nom
+    - PrÃ©nom
+    - TÃ©lÃ©phone
+    - Mail
+Et de complÃ©ter ces informations par une recherche en ligne.
+RÃ©pondez sous forme de texte structurÃ©, par exemple :
+Nom: Doe
+PrÃ©nom: John
+TÃ©lÃ©phone: 0123456789
+Mail: john.doe@example.com
+Entreprise: Example Corp
+"""
+tavily_search_tool = {
+    "type": "function",
+    "function": {
+        "name": "tavily_search",
+        "description": "Recherche en ligne pour obtenir des informations sur une personne ou une entreprise.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Par exemple : 'John Doe, PDG de Example Corp'."}
+            },
+            "required": ["query"]
+        }
+    }
+}
+extraction_agent = {
+    "name": "extraction",
+    "instructions": assistant_prompt_instruction,
+    "model": "gpt-4o",
+    "tools": [tavily_search_tool]
+}
+
+# Assistant 2 : Description des produits
+product_assistant_instruction = """
+Tu es un responsable commerciale.
+Ta tÃ¢che est de rÃ©aliser en fonction des informations sur le client ainsi que des notes de lâ€™utilisateur un matching entre nos produits et les besoins du client.
+
+Voici la prÃ©sentation de ce que Nin-IA propose : 
+
+**Propulsez Votre Expertise en IA avec NIN-IA : Formations, Modules et Audits, la Triade du SuccÃ¨s !**
+
+L'Intelligence Artificielle est la clÃ© du futur, et NIN-IA vous offre la boÃ®te Ã  outils complÃ¨te pour la maÃ®triser. NosÂ **formations de pointe**Â sont au cÅ“ur de notre offre, vous dotant des compÃ©tences essentielles. Pour une flexibilitÃ© maximale et des besoins spÃ©cifiques, dÃ©couvrez nosÂ **modules IA Ã  la carte**. Et pour assurer le succÃ¨s de vos projets, nosÂ **audits IA experts**Â sont votre filet de sÃ©curitÃ©.
+
+**Notre prioritÃ© : Votre montÃ©e en compÃ©tences grÃ¢ce Ã  nos formations !**
+
+- **Formations de Pointe : Devenez un Expert en IA GÃ©nÃ©rative**Â : Nos formations vous plongent au cÅ“ur des algorithmes et des outils d'IA les plus performants. AdaptÃ©es Ã  tous les niveaux, elles vous permettent de crÃ©er du contenu innovant, d'optimiser vos processus et de surpasser vos concurrents.Â **Ne vous contentez pas de suivre la vague, surfez sur elle !**
+- **Modules IA : Apprentissage PersonnalisÃ©, Impact ImmÃ©diat**Â : Pour complÃ©ter votre formation ou rÃ©pondre Ã  des besoins prÃ©cis, explorez nos modules IA Ã  la carte. ConcentrÃ©s sur des compÃ©tences spÃ©cifiques, ils vous offrent un apprentissage ciblÃ© et une mise en Å“uvre rapide.Â **La flexibilitÃ© au service de votre expertise !**
+- **Audits IA : SÃ©curisez Votre Investissement, Maximisez Votre ROI**Â : Avant d'investir massivement dans l'IA, assurez-vous que votre stratÃ©gie est solide. Nos audits IA identifient les points faibles de votre projet, optimisent vos ressources et Ã©vitent les erreurs coÃ»teuses.Â **L'assurance d'un succÃ¨s durable !**
+
+**DÃ©tails de Notre Offre :**
+
+- **Formations StructurÃ©es :**
+    - **IA GÃ©nÃ©rative 101 : Les Fondamentaux (DÃ©butant) :**Â Apprenez les bases et explorez les premiÃ¨res applications concrÃ¨tes.
+    - **CrÃ©ation de Contenu RÃ©volutionnaire avec ChatGPT (IntermÃ©diaire) :**Â MaÃ®trisez ChatGPT pour gÃ©nÃ©rer des textes percutants.
+    - **Deep Learning pour l'IA GÃ©nÃ©rative : Devenez un Expert (AvancÃ©) :**Â Plongez au cÅ“ur des rÃ©seaux neuronaux et dÃ©bloquez le plein potentiel de l'IA.
+    - **IA GÃ©nÃ©rative pour le Marketing Digital (SpÃ©cial Marketing) :**Â Multipliez vos leads et convertissez vos prospects grÃ¢ce Ã  l'IA.
+    - **IntÃ©gration de l'IA GÃ©nÃ©rative dans Votre Entreprise (SpÃ©cial Entreprise) :**Â IntÃ©grez l'IA dans vos processus et crÃ©ez de nouvelles opportunitÃ©s.
+- **Modules IA Ã  la Carte (NouveautÃ© !) :**
+    - **[Exemple] : "Module : Optimisation des Prompts pour ChatGPT" :**Â MaÃ®trisez l'art de formuler des requÃªtes efficaces pour obtenir des rÃ©sultats exceptionnels avec ChatGPT.Â **Transformez vos instructions en or !**
+    - **[Exemple] : "Module : Analyse de Sentiments avec l'IA" :**Â Comprenez les Ã©motions de vos clients et adaptez votre communication en consÃ©quence.Â **Transformez les donnÃ©es en insights prÃ©cieux !**
+    - **[Exemple] : "Module : GÃ©nÃ©ration d'Images avec Stable Diffusion" :**Â CrÃ©ez des visuels Ã©poustouflants en quelques clics grÃ¢ce Ã  la puissance de l'IA.Â **Donnez vie Ã  vos idÃ©es les plus folles !**
+- **Audits IA Experts :**
+    - Analyse approfondie de votre projet IA.
+    - Identification des risques et des opportunitÃ©s.
+    - Recommandations personnalisÃ©es pour optimiser votre ROI.
+    - Garantie de conformitÃ© rÃ©glementaire.
+
+**Pourquoi choisir NIN-IA ?**
+
+- **Expertise Reconnue :**Â Des formateurs passionnÃ©s et des experts en IA Ã  votre service.
+- **Approche PÃ©dagogique Innovante :**Â Apprentissage pratique et mises en situation rÃ©elles.
+- **Offre ComplÃ¨te :**Â Formations, modules et audits pour rÃ©pondre Ã  tous vos besoins.
+- **Accompagnement PersonnalisÃ© :**Â Nous sommes Ã  vos cÃ´tÃ©s Ã  chaque Ã©tape de votre parcours.
+"""
+product_agent = {
+    "name": "produits",
+    "instructions": product_assistant_instruction,
+    "model": "gpt-4o",
+    "tools": None
+}
+
+# Assistant 3 : RÃ©daction du mail
+email_assistant_instruction = """
+Tu es un expert en rÃ©daction de mails de relance et assistant dâ€™Emeline de Nin-IA.
+Vos mails commencent toujours par "Bonjour [prÃ©nom]" et se terminent par "Cordialement Emeline Boulange, Co-dirigeante de Nin-IA.
+
+TA tÃ¢che est de rÃ©diger un mail de relance percutant pour convertir le lead, en tenant compte :
+
+- des informations extraites (Assistant 1),
+- du matching de notre offre (Assistant 2),
+- de la qualification et des notes du lead.
+Veillez Ã  intÃ©grer les notes de l'utilisateur pour instaurer une relation de proximitÃ©.
+Et surtout bien mettre en place le contexte de la rencontre si cela est prÃ©cisÃ© 
+RÃ©pondez sous forme d'un texte structurÃ© (salutation, introduction, corps, conclusion).
+"""
+email_agent = {
+    "name": "mail",
+    "instructions": email_assistant_instruction,
+    "model": "gpt-4o",
+    "tools": None
+}
+
+##############################
+# Pipeline complet           #
+##############################
+def build_agent1_message(ocr_text, qualification, note, contacts=None):
+    """
+    Message utilisateur de l'assistant 1 (extraction & recherche).
+
+    Avec `contacts` (résultat de extract_contacts), les champs détectés
+    localement sont fournis sous forme structurée ; s'ils sont tous fiables,
+    seul le texte restant est transmis et l'assistant n'a plus qu'à compléter
+    par la recherche en ligne.
+    """
+    if contacts is not None:
+        fields, confidence = best_fields(contacts)
+        if is_confident(confidence):
+            return (
+                f"Qualification : {qualification}\n"
+                f"Note : {note}\n"
+                f"Coordonnées vérifiées :\n{format_contacts(fields, contacts)}\n"
+                f"Autres informations de la carte :\n{residual_text(ocr_text, fields)}\n\n"
+                "Recopiez telles quelles les coordonnées vérifiées (Nom, Prénom, Téléphone, Mail) "
+                "et complétez uniquement par une recherche en ligne."
+            )
+    message = (
+        f"DonnÃ©es extraites de la carte :\n"
+        f"Qualification : {qualification}\n"
+        f"Note : {note}\n"
+        f"Texte : {ocr_text}\n\n"
+        "Veuillez extraire les informations clÃ©s (Nom, PrÃ©nom, TÃ©lÃ©phone, Mail) "
+        "et complÃ©ter par une recherche en ligne."
+    )
+    if contacts is not None:
+        message += f"\n\nChamps détectés automatiquement (à vérifier) :\n{format_contacts(fields, contacts)}"
+    return message
+
+def build_agent2_message(agent1, qualification, note):
+    """Message utilisateur de l'assistant 2 (matching produits)."""
+    return (
+        f"Informations sur l'entreprise extraites :\n{agent1}\n\n"
+        f"Qualification : {qualification}\n"
+        f"Note : {note}\n\n"
+        "Veuillez rÃ©diger un matching entre nos produits et les besoins du client, "
+        "en mettant en avant les avantages de nos offres."
+    )
+
+def build_agent3_message(agent1, agent2, qualification, note):
+    """Message utilisateur de l'assistant 3 (rédaction du mail)."""
+    return (
+        f"Informations sur l'intervenant et son entreprise :\n{agent1}\n\n"
+        f"Matching de notre offre :\n{agent2}\n\n"
+        f"Qualification : {qualification}\n"
+        f"Note : {note}\n\n"
+        "Veuillez rÃ©diger un mail de relance percutant pour convertir ce lead. "
+        "Le mail doit commencer par 'Bonjour [prÃ©nom]' et se terminer par 'Cordialement Rach Startup manager et Program Manager Ã  Quai Alpha'."
+    )
+
+def process_card(image_bytes, qualification, note, on_stage=None, checkpoint=None, on_checkpoint=None,
+                 on_duplicate=None, trace=None):
+    """
+    Traite une carte de bout en bout et retourne le lead (dict des colonnes
+    LEAD_COLUMNS et des textes TEXT_FIELDS), sans l'enregistrer (voir save_lead).
+
+    on_stage(stage, texte, termine) est appelé pour "ocr", "agent1", "agent2"
+    et "agent3" : avec le texte partiel pendant le streaming (termine=False)
+    puis avec le texte final (termine=True).
+
+    checkpoint contient les sorties déjà calculées ("ocr_text", "agent1",
+    "agent2", "agent3") : les étapes correspondantes ne sont pas rejouées.
+    on_checkpoint(colonne, valeur) est appelé après chaque étape exécutée.
+
+    Si on_duplicate est fourni, les leads existants sont recherchés juste
+    après l'OCR (voir duplicates.find_duplicate). En cas de doublon,
+    on_duplicate(doublon) retourne "reuse" (garder le lead existant),
+    "update" (le mettre à jour avec les champs fiables de la nouvelle carte,
+    sans relancer les assistants) ou "process" (traiter la carte normalement), ou lève
+    DuplicateLeadError pour laisser l'utilisateur décider. Dans les deux
+    premiers cas, le lead retourné porte "duplicate_of" et "duplicate_action".
+
+    Les étapes sont mesurées dans trace (une nouvelle Trace par défaut),
+    rattachée au lead retourné sous la clé "trace" ; save_lead enregistre
+    ses spans avec l'id du lead.
+    """
+    trace = trace or Trace()
+    with trace.activate():
+        lead = _process_card(image_bytes, qualification, note, on_stage, checkpoint, on_checkpoint, on_duplicate)
+    lead["trace"] = trace
+    return lead
+
+def _process_card(image_bytes, qualification, note, on_stage, checkpoint, on_checkpoint, on_duplicate):
+    notify = on_stage or (lambda stage, text, done: None)
+    checkpoint = checkpoint or {}
+
+    def stage(column, compute):
+        value = checkpoint.get(column)
+        if not value:
+            # run_ocr mesure lui-même l'étape "ocr"
+            with span(column) if column != "ocr_text" else nullcontext():
+                value = compute()
+            if on_checkpoint:
+                on_checkpoint(column, value)
+        return value
+
+    ocr_text = stage("ocr_text", lambda: run_ocr(image_bytes))
+    if not ocr_text:
+        raise NoTextError("Aucun texte exploitable n'a été extrait.")
+    notify("ocr", ocr_text, True)
+
+    # Extraction locale des coordonnées : quelques millisecondes, avant tout appel au modèle
+    contacts = extract_contacts(ocr_text)
+    local_fields, local_confidence = best_fields(contacts)
+    image_phash = perceptual_hash(image_bytes)
+
+    # Un job repris après l'assistant 1 a déjà passé la détection des doublons
+    if on_duplicate and not checkpoint.get("agent1"):
+        with span("dedup"):
+            duplicate = find_duplicate(local_fields["mail"], local_fields["telephone"], image_phash,
+                                       nom=local_fields["nom"])
+        if duplicate:
+            action = on_duplicate(duplicate)
+            if action in ("reuse", "update"):
+                existing = get_lead_details(get_connection().cursor(), duplicate["id"])
+                lead = dict(existing, duplicate_of=duplicate["id"], duplicate_action=action)
+                if action == "update":
+                    # Seuls les champs fiables de la carte remplacent ceux du lead : les réponses des
+                    # assistants, conservées, décrivent toujours la même personne
+                    fields = merge_fields(local_fields, local_confidence, {key: existing[key] for key in local_fields})
+                    lead.update(fields, ocr_text=ocr_text, qualification=qualification, note=note,
+                                mail_key=mail_key(fields["mail"]) or None,
+                                telephone_key=phone_key(fields["telephone"]) or None,
+                                image_phash=image_phash)
+                return lead
+
+    agent1 = stage("agent1", lambda: run_agent(
+        extraction_agent, build_agent1_message(ocr_text, qualification, note, contacts),
+        on_text=lambda partial: notify("agent1", clean_response(partial), False)
+    ))
+    notify("agent1", agent1, True)
+    parsed_data = merge_fields(local_fields, local_confidence, parse_agent1_response(agent1))
+
+    agent2 = stage("agent2", lambda: run_agent(
+        product_agent, build_agent2_message(agent1, qualification, note),
+        on_text=lambda partial: notify("agent2", clean_response(partial), False)
+    ))
+    notify("agent2", agent2, True)
+
+    agent3 = stage("agent3", lambda: run_agent(
+        email_agent, build_agent3_message(agent1, agent2, qualification, note),
+        on_text=lambda partial: notify("agent3", clean_response(partial), False)
+    ))
+    notify("agent3", agent3, True)
+
+    return {
+        "ocr_text": ocr_text,
+        "nom": parsed_data["nom"],
+        "prenom": parsed_data["prenom"],
+        "telephone": parsed_data["telephone"],
+        "mail": parsed_data["mail"],
+        "agent1": agent1,
+        "agent2": agent2,
+        "agent3": agent3,
+        "qualification": qualification,
+        "note": note,
+        "mail_key": mail_key(parsed_data["mail"]) or None,
+        "telephone_key": phone_key(parsed_data["telephone"]) or None,
+        "image_phash": image_phash,
+    }
+
+def save_lead(conn, lead, job_id=None):
+    """
+    Enregistre un lead retourné par process_card dans la transaction de conn
+    et retourne son id : insertion, ou mise à jour / réutilisation du lead
+    existant dont il est le doublon. Les mesures de sa trace sont enregistrées
+    dans la même transaction.
+    """
+    trace = lead.get("trace") or Trace()
+    with trace.activate(), span("db_insert"):
+        lead_id = lead.get("duplicate_of")
+        if lead_id is None:
+            lead_id = conn.execute(INSERT_LEAD_SQL, lead_values(lead)).lastrowid
+            store_texts(conn, lead_id, {field: lead[field] for field in TEXT_FIELDS})
+        elif lead["duplicate_action"] == "update":
+            conn.execute(UPDATE_DUPLICATE_SQL, (
+                lead["nom"], lead["prenom"], lead["telephone"], lead["mail"],
+                lead["qualification"], lead["note"], lead["mail_key"], lead["telephone_key"], lead["image_phash"],
+                lead_id
+            ))
+            store_texts(conn, lead_id, {"ocr_text": lead["ocr_text"]})
+    trace.save(conn, lead_id, job_id)
+    return lead_id
+
+def save_leads(leads):
+    """Enregistre plusieurs leads dans une seule transaction ; retourne leurs ids."""
+    return write(lambda conn: [save_lead(conn, lead) for lead in leads])
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Limitation de concurrence et de débit par fournisseur (Mistral, OpenAI, Tavily).
+
+Chaque fournisseur a un nombre maximal d'appels simultanés et un nombre
+maximal d'appels par minute, configurables par variables d'environnement :
+<FOURNISSEUR>_MAX_CONCURRENCY et <FOURNISSEUR>_RATE_PER_MIN (0 = illimité).
+"""
+import os
+import threading
+import time
+
+
+class ProviderLimiter:
+    """Sémaphore de concurrence + espacement minimal entre deux appels."""
+
+    def __init__(self, name, max_concurrency, rate_per_minute):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_per_minute = rate_per_minute
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _wait_for_slot(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        try:
+            self._wait_for_slot()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._semaphore.release()
+        return False
+
+
+def _limiter_from_env(name, default_concurrency, default_rate):
+    prefix = name.upper()
+    return ProviderLimiter(
+        name,
+        int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(default_concurrency))),
+        float(os.getenv(f"{prefix}_RATE_PER_MIN", str(default_rate))),
+    )
+
+
+# Limiteurs partagés par toutes les sessions et tous les workers du processus
+limiters = {
+    "mistral": _limiter_from_env("mistral", 2, 60),
+    "openai": _limiter_from_env("openai", 8, 500),
+    "tavily": _limiter_from_env("tavily", 4, 100),
+}
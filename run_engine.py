@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur d'exécution des runs d'assistants basé sur l'API de streaming.
+
+Plutôt que d'interroger `runs.retrieve` toutes les secondes, on consomme les
+événements du run au fil de l'eau : le texte partiel est transmis dès qu'il
+arrive, les appels d'outils sont traités dès l'événement `requires_action`
+et le run se termine dès l'événement final.
+"""
+import os
+import time
+
+from openai import APITimeoutError
+
+from metrics import record
+
+# Délai maximal (en secondes) accordé à un run, appels d'outils compris
+RUN_TIMEOUT = float(os.getenv("RUN_TIMEOUT", "180"))
+
+TERMINAL_EVENTS = {
+    "thread.run.completed": "completed",
+    "thread.run.failed": "failed",
+    "thread.run.cancelled": "cancelled",
+    "thread.run.expired": "expired",
+    "thread.run.incomplete": "incomplete",
+}
+
+
+class RunError(Exception):
+    """Le run s'est terminé sans succès (failed, cancelled, expired...)."""
+
+    def __init__(self, status, message=""):
+        self.status = status
+        super().__init__(f"Run terminé avec le statut '{status}'" + (f" : {message}" if message else ""))
+
+
+class RunTimeoutError(RunError):
+    """Le run a dépassé le délai maximal autorisé."""
+
+    def __init__(self, timeout):
+        super().__init__("timeout", f"délai de {timeout:.0f} s dépassé")
+
+
+class _RunState:
+    def __init__(self):
+        self.thread_id = None
+        self.run_id = None
+        self.text = ""
+
+
+def _consume(stream, state, on_text, deadline, timeout):
+    """Lit les événements d'un stream jusqu'à un statut final ou requires_action."""
+    for event in stream:
+        name = event.event
+        if name == "thread.run.created":
+            state.thread_id = event.data.thread_id
+            state.run_id = event.data.id
+        elif name == "thread.message.created":
+            # Plusieurs messages successifs : on les sépare comme des paragraphes
+            if state.text:
+                state.text += "\n\n"
+        elif name == "thread.message.delta":
+            for part in event.data.delta.content or []:
+                if part.type == "text" and part.text and part.text.value:
+                    state.text += part.text.value
+                    if on_text:
+                        on_text(state.text)
+        elif name == "thread.run.requires_action" or name in TERMINAL_EVENTS:
+            return event.data
+        elif name == "error":
+            raise RunError("error", str(event.data))
+        if time.monotonic() > deadline:
+            raise RunTimeoutError(timeout)
+    return None
+
+
+def _cancel(client, state):
+    """Annule le run côté serveur (best effort)."""
+    if state.thread_id and state.run_id:
+        try:
+            client.beta.threads.runs.cancel(thread_id=state.thread_id, run_id=state.run_id)
+        except Exception:
+            pass
+
+
+def stream_run(client, assistant_id, user_message, tool_handler=None, on_text=None, timeout=None):
+    """
+    Crée un thread avec le message utilisateur, lance le run en streaming et
+    retourne le texte complet produit par l'assistant.
+
+    - tool_handler(tool_calls) doit retourner la liste des
+      {"tool_call_id": ..., "output": ...} à soumettre ; il est rappelé à
+      chaque nouvelle étape `requires_action`.
+    - on_text(texte_partiel) est appelé à chaque fragment de texte reçu.
+    """
+    timeout = timeout or RUN_TIMEOUT
+    deadline = time.monotonic() + timeout
+    state = _RunState()
+    try:
+        with client.beta.threads.create_and_run_stream(
+            assistant_id=assistant_id,
+            thread={"messages": [{"role": "user", "content": user_message}]},
+            timeout=timeout,
+        ) as stream:
+            record(rounds=1)
+            run = _consume(stream, state, on_text, deadline, timeout)
+
+        while run is not None and run.status == "requires_action":
+            if tool_handler is None:
+                raise RunError("requires_action", "aucun gestionnaire d'outils fourni")
+            tool_outputs = tool_handler(run.required_action.submit_tool_outputs.tool_calls)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RunTimeoutError(timeout)
+            with client.beta.threads.runs.submit_tool_outputs_stream(
+                thread_id=state.thread_id,
+                run_id=state.run_id,
+                tool_outputs=tool_outputs,
+                timeout=remaining,
+            ) as stream:
+                record(rounds=1)
+                run = _consume(stream, state, on_text, deadline, timeout)
+    except APITimeoutError:
+        _cancel(client, state)
+        raise RunTimeoutError(timeout)
+    except RunTimeoutError:
+        _cancel(client, state)
+        raise
+
+    if run is None:
+        raise RunError("unknown", "le stream s'est terminé sans statut final")
+    # Consommation cumulée de tous les tours du run
+    usage = getattr(run, "usage", None)
+    if usage:
+        record(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    if run.status != "completed":
+        last_error = getattr(run, "last_error", None)
+        raise RunError(run.status, last_error.message if last_error else "")
+    return state.text.strip()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des recherches Tavily.
+
+Les requêtes sont normalisées (casse, accents composés, espaces) puis mises
+en cache dans leads.db avec une durée de vie configurable. Les requêtes
+identiques lancées en même temps (plusieurs sessions Streamlit, plusieurs
+appels d'outils) partagent une seule requête Tavily en cours.
+
+Les compteurs (hits, misses, mutualisées, expirées) sont enregistrés par
+jour dans leads.db : ceux des workers externes (`python jobs.py`) sont
+comptés avec ceux de l'interface, pour dimensionner SEARCH_CACHE_TTL.
+"""
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+
+from db import execute_write, get_connection, write
+
+# Durée de vie d'une entrée (en secondes) et nombre maximal d'entrées conservées
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+
+# Protège uniquement _in_flight : ni lecture ni écriture SQLite sous ce verrou
+_lock = threading.Lock()
+_in_flight = {}
+STAT_COUNTERS = ("hits", "misses", "coalesced", "expired")
+
+
+def normalize_query(query):
+    """Normalise une requête pour que les variantes triviales partagent la même entrée."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(query.split())
+
+
+def query_key(query):
+    """Clé de cache d'une requête normalisée."""
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def search_cache_stats(days=7):
+    """Compteurs hits / misses / coalesced / expired de tous les processus sur les `days` derniers jours."""
+    stats = dict.fromkeys(STAT_COUNTERS, 0)
+    rows = get_connection().execute(
+        "SELECT counter, SUM(value) FROM search_cache_stats WHERE day > date('now', ?) GROUP BY counter",
+        (f"-{days} days",)
+    )
+    stats.update(rows)
+    return stats
+
+
+def _count(counter):
+    # Simple statistique : inutile d'attendre le commit
+    execute_write(
+        "INSERT INTO search_cache_stats (day, counter, value) VALUES (date('now'), ?, 1) "
+        "ON CONFLICT (day, counter) DO UPDATE SET value = value + 1",
+        (counter,), wait=False
+    )
+
+
+def _lookup(key, now):
+    row = get_connection().execute(
+        "SELECT result, created_at FROM search_cache WHERE query_key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    if now - row[1] > SEARCH_CACHE_TTL:
+        execute_write("DELETE FROM search_cache WHERE query_key = ?", (key,), wait=False)
+        _count("expired")
+        return None
+    execute_write("UPDATE search_cache SET last_access = ? WHERE query_key = ?", (now, key), wait=False)
+    return row[0]
+
+
+def _store(key, query, result, now):
+    def store(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO search_cache (query_key, query, result, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, normalize_query(query), result, now, now)
+        )
+        conn.execute("DELETE FROM search_cache WHERE created_at < ?", (now - SEARCH_CACHE_TTL,))
+        conn.execute("""
+            DELETE FROM search_cache WHERE query_key IN (
+                SELECT query_key FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        """, (SEARCH_CACHE_MAX_ENTRIES,))
+
+    write(store)
+
+
+def cached_search(query, search_fn):
+    """
+    Retourne le résultat de search_fn(query), depuis le cache si possible.
+    Si la même requête est déjà en cours dans un autre thread, on attend son
+    résultat au lieu de relancer la recherche.
+    """
+    key = query_key(query)
+    cached = _lookup(key, time.time())
+    if cached is not None:
+        _count("hits")
+        return cached
+    with _lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _in_flight[key] = future
+    if not owner:
+        _count("coalesced")
+        return future.result()
+
+    try:
+        # Une recherche identique a pu se terminer entre la lecture du cache et la réservation
+        result = _lookup(key, time.time())
+        if result is not None:
+            _count("hits")
+        else:
+            _count("misses")
+            result = search_fn(query)
+            _store(key, query, result, time.time())
+    except Exception as e:
+        with _lock:
+            _in_flight.pop(key, None)
+        future.set_exception(e)
+        raise
+    # Le résultat est déjà en cache : les appels suivants le liront sans attendre
+    with _lock:
+        _in_flight.pop(key, None)
+    future.set_result(result)
+    return result
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage compressé des textes longs des leads (OCR, agents 1 à 3).
+
+Ces textes représentent l'essentiel du volume de leads.db alors que la
+liste, la recherche des doublons et l'export des colonnes courtes n'en ont
+pas besoin. Ils sont rangés hors de la ligne du lead, dans la table
+`lead_texts` (une ligne par lead, un BLOB compressé par champ), et la vue
+`leads_full` les recompose de façon transparente : seule la lecture du
+détail d'un lead (ou un export qui les demande) les décompresse.
+
+Chaque BLOB décrit sa propre compression (premier octet) :
+- zstd avec un dictionnaire si le paquet optionnel zstandard est installé ;
+- sinon zlib, avec un dictionnaire prédéfini (zdict) quand il en existe un.
+Les dictionnaires sont construits à partir des textes déjà enregistrés,
+par champ (les réponses de l'agent 2 se ressemblent beaucoup d'un lead à
+l'autre), et conservés dans `text_dictionaries` : un BLOB reste lisible même après un
+nouvel apprentissage.
+
+Utilisable en ligne de commande :
+    python text_store.py train       # apprend de nouveaux dictionnaires
+    python text_store.py recompress  # réencode les textes avec les derniers dictionnaires
+    python text_store.py report [--vacuum]
+"""
+import argparse
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TEXT_FIELDS = ("ocr_text", "agent1", "agent2", "agent3")
+# "zstd" ou "zlib" ; zstd n'est utilisé que si le paquet zstandard est installé
+TEXT_CODEC = os.getenv("TEXT_CODEC", "zstd")
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "9"))
+# Textes récents composant un dictionnaire, minimum requis et taille (32 Ko au plus pour zlib)
+TEXT_DICT_SAMPLES = int(os.getenv("TEXT_DICT_SAMPLES", "500"))
+TEXT_DICT_MIN_SAMPLES = int(os.getenv("TEXT_DICT_MIN_SAMPLES", "20"))
+TEXT_DICT_SIZE = int(os.getenv("TEXT_DICT_SIZE", str(64 * 1024)))
+# En deçà, le texte est stocké tel quel : l'en-tête coûterait plus que le gain
+TEXT_MIN_COMPRESS = 64
+
+# Premier octet des BLOBs
+CODEC_RAW, CODEC_ZLIB, CODEC_ZLIB_DICT, CODEC_ZSTD_DICT = range(4)
+# Fenêtre de deflate : un zdict au-delà de 32 Ko n'est jamais utilisé
+_ZLIB_WINDOW = 32 * 1024
+_DICT_ID = struct.Struct(">I")
+
+# Fichier de base de chaque connexion enregistrée (register_functions) : les caches
+# ci-dessous sont propres à une base, les ids de dictionnaire n'ayant de sens que dans celle-ci
+_databases = {}
+# Dictionnaires déjà chargés (immuables une fois enregistrés) et dictionnaire courant par champ
+_dictionaries = {}
+_active = {}
+_lock = threading.Lock()
+# Décompresseurs zstd par thread (une instance ne doit pas servir à deux threads à la fois)
+_local = threading.local()
+
+
+def _codec():
+    return "zstd" if TEXT_CODEC == "zstd" and zstandard is not None else "zlib"
+
+
+def _database(conn):
+    database = _databases.get(id(conn))
+    if database is None:
+        database = _databases[id(conn)] = conn.execute("PRAGMA database_list").fetchone()[2]
+    return database
+
+
+def _dictionary(conn, dict_id):
+    """
+    (codec, données, dictionnaire zstd préparé ou None) du dictionnaire
+    dict_id, lu et préparé une seule fois par processus.
+    """
+    key = (_database(conn), dict_id)
+    entry = _dictionaries.get(key)
+    if entry is None:
+        row = conn.execute("SELECT codec, data FROM text_dictionaries WHERE id = ?", (dict_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Dictionnaire de compression {dict_id} introuvable")
+        entry = _dictionaries[key] = _prepare(row[0], bytes(row[1]))
+    return entry
+
+
+def _prepare(codec, data):
+    if codec != "zstd":
+        return codec, data, None
+    if zstandard is None:
+        raise RuntimeError("Ce texte est compressé avec zstd : installez le paquet zstandard pour le lire.")
+    zstd_dict = zstandard.ZstdCompressionDict(data, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    # Dictionnaire préparé une fois pour toutes, au lieu d'une fois par texte compressé
+    zstd_dict.precompute_compress(level=TEXT_COMPRESSION_LEVEL)
+    return codec, data, zstd_dict
+
+
+def _active_dictionary(conn, field):
+    """Id du dernier dictionnaire appris pour field, utilisable avec le codec courant (ou None)."""
+    key = (_database(conn), field)
+    if key not in _active:
+        codecs = ("zstd", "zlib") if _codec() == "zstd" else ("zlib",)
+        row = conn.execute(
+            f"SELECT MAX(id) FROM text_dictionaries WHERE field = ? AND codec IN ({', '.join('?' for _ in codecs)})",
+            (field, *codecs)
+        ).fetchone()
+        with _lock:
+            _active.setdefault(key, row[0])
+    return _active[key]
+
+
+def compress_text(conn, field, text):
+    """Encode text (str ou None) en BLOB autodescriptif, avec le dictionnaire courant de field."""
+    if text is None:
+        return None
+    data = text.encode("utf-8")
+    if len(data) < TEXT_MIN_COMPRESS:
+        return bytes([CODEC_RAW]) + data
+    dict_id = _active_dictionary(conn, field)
+    if dict_id is None:
+        return bytes([CODEC_ZLIB]) + zlib.compress(data, TEXT_COMPRESSION_LEVEL)
+    codec, dictionary, zstd_dict = _dictionary(conn, dict_id)
+    if codec == "zstd":
+        compressor = zstandard.ZstdCompressor(
+            level=TEXT_COMPRESSION_LEVEL, dict_data=zstd_dict,
+            write_checksum=False, write_content_size=True, write_dict_id=False,
+        )
+        return bytes([CODEC_ZSTD_DICT]) + _DICT_ID.pack(dict_id) + compressor.compress(data)
+    compressor = zlib.compressobj(TEXT_COMPRESSION_LEVEL, zdict=dictionary)
+    return bytes([CODEC_ZLIB_DICT]) + _DICT_ID.pack(dict_id) + compressor.compress(data) + compressor.flush()
+
+
+def decompress_text(conn, blob):
+    """Décode un BLOB produit par compress_text (None reste None)."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    codec = blob[0]
+    if codec == CODEC_RAW:
+        return blob[1:].decode("utf-8")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(blob[1:]).decode("utf-8")
+    dict_id = _DICT_ID.unpack_from(blob, 1)[0]
+    _, dictionary, zstd_dict = _dictionary(conn, dict_id)
+    payload = blob[1 + _DICT_ID.size:]
+    if codec == CODEC_ZLIB_DICT:
+        return zlib.decompressobj(zdict=dictionary).decompress(payload).decode("utf-8")
+    if codec == CODEC_ZSTD_DICT:
+        decompressors = _local.__dict__.setdefault("decompressors", {})
+        if zstd_dict not in decompressors:
+            decompressors[zstd_dict] = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+        return decompressors[zstd_dict].decompress(payload).decode("utf-8")
+    raise ValueError(f"Format de texte compressé inconnu : {codec}")
+
+
+def register_functions(conn):
+    """
+    Déclare sur conn les fonctions SQL utilisées par la vue leads_full et la
+    migration : lead_text(blob) et lead_text_compress(champ, texte). Toute
+    connexion qui lit la vue ou écrit dans leads (triggers FTS) en a besoin.
+    """
+    _databases[id(conn)] = conn.execute("PRAGMA database_list").fetchone()[2]
+    conn.create_function("lead_text", 1, lambda blob: decompress_text(conn, blob), deterministic=True)
+    conn.create_function("lead_text_compress", 2, lambda field, text: compress_text(conn, field, text))
+
+
+def store_texts(conn, lead_id, texts):
+    """
+    Enregistre (ou remplace) les textes donnés ({champ: texte}) du lead
+    lead_id, dans la transaction de conn. Les champs absents sont conservés.
+    """
+    fields = [field for field in TEXT_FIELDS if field in texts]
+    if not fields:
+        return
+    values = [compress_text(conn, field, texts[field]) for field in fields]
+    # Pas d'UPSERT : ses triggers BEFORE INSERT se déclencheraient aussi en cas de conflit,
+    # et l'index plein texte recevrait deux suppressions pour une seule modification
+    updated = conn.execute(
+        f"UPDATE lead_texts SET {', '.join(f'{field} = ?' for field in fields)} WHERE lead_id = ?",
+        (*values, lead_id)
+    ).rowcount
+    if not updated:
+        conn.execute(
+            f"INSERT INTO lead_texts (lead_id, {', '.join(fields)}) VALUES (?{', ?' * len(fields)})",
+            (lead_id, *values)
+        )
+
+
+def _train(samples):
+    """
+    (codec, dictionnaire) construit sur samples (liste de bytes, du plus
+    récent au plus ancien), ou None si l'échantillon est insuffisant.
+
+    Le dictionnaire est le contenu brut des textes récents : les sorties des
+    agents reprennent les mêmes tournures et descriptions de produits, que
+    le compresseur référence directement. Sur des textes de ce type, il
+    compresse mieux qu'un dictionnaire appris par zstd (train_dictionary),
+    qui ne garde que des fragments. Les textes les plus récents sont placés
+    en fin de dictionnaire, où les références sont les plus courtes.
+    """
+    if len(samples) < TEXT_DICT_MIN_SAMPLES:
+        return None
+    codec = _codec()
+    size = TEXT_DICT_SIZE if codec == "zstd" else min(TEXT_DICT_SIZE, _ZLIB_WINDOW)
+    dictionary = b""
+    for sample in samples:
+        if len(dictionary) >= size:
+            break
+        dictionary = sample + b"\n" + dictionary
+    return codec, dictionary[-size:]
+
+
+def train_dictionaries(conn, source="leads_full", fields=TEXT_FIELDS):
+    """
+    Apprend un dictionnaire par champ sur les TEXT_DICT_SAMPLES textes les
+    plus récents de source et l'enregistre dans text_dictionaries (dans la
+    transaction de conn). Retourne {champ: id} des dictionnaires créés.
+    """
+    created = {}
+    for field in fields:
+        rows = conn.execute(
+            f"SELECT {field} FROM {source} WHERE {field} IS NOT NULL AND {field} != '' ORDER BY id DESC LIMIT ?",
+            (TEXT_DICT_SAMPLES,)
+        ).fetchall()
+        trained = _train([row[0].encode("utf-8") for row in rows])
+        if trained is None:
+            continue
+        codec, data = trained
+        dict_id = conn.execute(
+            "INSERT INTO text_dictionaries (field, codec, data, samples) VALUES (?, ?, ?, ?)",
+            (field, codec, data, len(rows))
+        ).lastrowid
+        database = _database(conn)
+        with _lock:
+            _dictionaries[(database, dict_id)] = _prepare(codec, data)
+            _active[(database, field)] = dict_id
+        created[field] = dict_id
+    return created
+
+
+def recompress(conn, fields=TEXT_FIELDS):
+    """Réencode les textes de fields avec les dictionnaires courants ; retourne le nombre de leads traités."""
+    rows = conn.execute(f"SELECT lead_id, {', '.join(fields)} FROM lead_texts").fetchall()
+    for lead_id, *blobs in rows:
+        store_texts(conn, lead_id, {field: decompress_text(conn, blob) for field, blob in zip(fields, blobs)})
+    return len(rows)
+
+
+def storage_report(conn):
+    """
+    Volumes par champ (octets du texte brut et du BLOB stocké), taille de
+    l'index plein texte, textes et images restant dans la file de jobs, et
+    durées d'un parcours complet de la table leads (colonnes courtes) et
+    d'une lecture de tous les textes.
+    """
+    report = {"fields": {}}
+    for field in TEXT_FIELDS:
+        stored, raw = 0, 0
+        for (blob,) in conn.execute(f"SELECT {field} FROM lead_texts WHERE {field} IS NOT NULL"):
+            stored += len(blob)
+            raw += len(decompress_text(conn, blob).encode("utf-8"))
+        report["fields"][field] = {"raw_bytes": raw, "stored_bytes": stored}
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    report["file_bytes"] = page_size * conn.execute("PRAGMA page_count").fetchone()[0]
+    report["free_bytes"] = page_size * conn.execute("PRAGMA freelist_count").fetchone()[0]
+    report["fts_bytes"] = conn.execute("SELECT COALESCE(SUM(LENGTH(block)), 0) FROM leads_fts_data").fetchone()[0]
+    report["leads"] = conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+    # Textes non compressés encore portés par la file de jobs (points de reprise des jobs en cours)
+    job_texts = " + ".join(f"COALESCE(LENGTH({c}), 0)" for c in TEXT_FIELDS + ("partial_text",))
+    report["jobs"], report["jobs_text_bytes"], report["jobs_image_bytes"] = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM({job_texts}), 0), COALESCE(SUM(LENGTH(image)), 0) FROM jobs"
+    ).fetchone()
+    for name, sql in (
+        ("scan_leads_ms", "SELECT id, nom, prenom, telephone, mail, qualification, timestamp FROM leads "
+                          "WHERE nom LIKE '%zzz%'"),
+        ("scan_full_ms", f"SELECT id, {', '.join(TEXT_FIELDS)} FROM leads_full"),
+    ):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        report[name] = 1000 * (time.perf_counter() - start)
+    return report
+
+
+def print_report(report):
+    print(f"{report['leads']} leads, fichier {report['file_bytes'] / 1024:.0f} Ko "
+          f"(dont {report['free_bytes'] / 1024:.0f} Ko de pages libres, {report['fts_bytes'] / 1024:.0f} Ko d'index plein texte)")
+    for field, sizes in report["fields"].items():
+        raw, stored = sizes["raw_bytes"], sizes["stored_bytes"]
+        ratio = f"{raw / stored:.1f}x" if stored else "-"
+        print(f"  {field:10s} brut {raw / 1024:9.0f} Ko   stocké {stored / 1024:9.0f} Ko   ratio {ratio}")
+    print(f"Jobs : {report['jobs']}, textes non compressés {report['jobs_text_bytes'] / 1024:.0f} Ko, "
+          f"images en attente {report['jobs_image_bytes'] / 1024:.0f} Ko")
+    print(f"Parcours de leads (colonnes courtes) : {report['scan_leads_ms']:.1f} ms")
+    print(f"Lecture de tous les textes (leads_full) : {report['scan_full_ms']:.1f} ms")
+
+
+def main(argv=None):
+    from db import get_connection, write
+
+    parser = argparse.ArgumentParser(description="Dictionnaires de compression et volumes des textes des leads.")
+    parser.add_argument("command", choices=("train", "recompress", "report"))
+    parser.add_argument("--vacuum", action="store_true", help="Compacte le fichier avant le rapport")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        created = write(train_dictionaries)
+        print(f"Dictionnaires appris : {', '.join(created) or 'aucun (pas assez de textes)'}")
+    elif args.command == "recompress":
+        print(f"{write(recompress)} leads réencodés.")
+    else:
+        conn = get_connection()
+        if args.vacuum:
+            conn.execute("VACUUM")
+        print_report(storage_report(conn))
+
+
+if __name__ == "__main__":
+    main()